@@ -3,32 +3,251 @@
 # [1] - filename.txt
 # [2] - how_many_words
 # [3] - word_min_len
+# [4] - processes (opcjonalnie)
+# [5] - index_file (opcjonalnie)
 # Przykładowo: python lab01.py pan-tadeusz-pl.txt 10 4
 # Polecenie powyżej wywoła skrypt z histogramem 10 najczęstszych słów i takich
 # które mają minimum 4 litery
+# Podając [4] > 0 plik jest czytany strumieniowo w kawałkach, a słowa liczone
+# równolegle w tylu procesach, np.: python lab01.py korpus.txt 10 4 8
+# Podając [5] zliczenia są trzymane w indeksie na dysku i kolejne zapytania
+# (inne [2], [3], ignorowane słowa) nie czytają już tekstu, np.:
+# python lab01.py pan-tadeusz-pl.txt 10 4 0 word_index.json
+# Gdy do pliku tylko dopisano dane, przeliczany jest wyłącznie nowy koniec pliku
+# (to, że zindeksowana część się nie zmieniła, sprawdza skrót całej tej części)
 
 # Importujemy co tam nam potrzebne
 import sys
 import os.path
 import codecs
+import heapq
+import hashlib
+import json
+from operator import itemgetter
+from multiprocessing import Pool
 from matplotlib import pyplot as plt
 from matplotlib.pyplot import figure
 from collections import Counter
 
+# Minimalny rozmiar kawałka pliku w trybie strumieniowym (w bajtach)
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+# Dzielimy plik na zakresy bajtów, których granice wypadają na końcach linii
+def find_chunks(file_name: str, chunk_size: int = CHUNK_SIZE, start: int = 0, file_size: int = None):
+
+    if file_size is None:
+        file_size = os.path.getsize(file_name)
+    chunks = []
+
+    with open(file_name, 'rb') as file:
+        while start < file_size:
+            file.seek(min(start + chunk_size, file_size))
+            # Doczytujemy do końca bieżącej linii, żeby nie przeciąć słowa
+            file.readline()
+            end = min(file.tell(), file_size)
+            chunks.append((start, end))
+            start = end
+
+    return chunks
+
+
+# Zliczamy słowa z jednego zakresu bajtów pliku
+def count_chunk(file_name: str, start: int, end: int, word_min_len: int):
+
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+
+    # Granice kawałków leżą na znaku nowej linii, więc split() na całym
+    # kawałku daje te same słowa co split() linia po linii
+    return Counter(word.lower() for word in text.split()
+                   if (len(word) >= word_min_len and word.isalpha()))
+
+
+# Zliczamy wszystkie słowa z zakresu bajtów pliku, pogrupowane po długości
+def count_chunk_by_length(file_name: str, start: int, end: int):
+
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+
+    # Długość liczymy przed lower(), tak jak filtr word_min_len
+    return Counter((len(word), word.lower()) for word in text.split() if word.isalpha())
+
+
+# Zliczamy słowa w pliku - kawałkami w puli procesów albo klasycznie linia po linii
+def count_words(file_name: str, word_min_len: int, processes: int = 0, chunk_size: int = CHUNK_SIZE):
+
+    # Tryb klasyczny
+    if processes <= 0:
+        with codecs.open(file_name, 'r', 'utf-8') as file:
+            return Counter(word.lower() for line in file for word in line.split()
+                           if (len(word) >= word_min_len and word.isalpha()))
+
+    # Tryb strumieniowy
+    chunks = find_chunks(file_name, chunk_size)
+    tasks = [(file_name, start, end, word_min_len) for start, end in chunks]
+    word_counter = Counter()
+    with Pool(processes) as pool:
+        # imap zachowuje kolejność kawałków, więc kolejność pierwszych wystąpień
+        # słów (a więc i remisy w rankingu) jest taka sama jak w trybie klasycznym
+        for partial_counter in pool.imap(_count_chunk_task, tasks):
+            word_counter.update(partial_counter)
+
+    return word_counter
+
+
+# Rozpakowanie argumentów dla puli procesów
+def _count_chunk_task(task: tuple):
+    return count_chunk(*task)
+
+
+def _count_chunk_by_length_task(task: tuple):
+    return count_chunk_by_length(*task)
+
+
+# Zliczamy słowa z zakresu [start, end) pogrupowane po długości, opcjonalnie w puli procesów
+def count_range_by_length(file_name: str, start: int, end: int, processes: int = 0,
+                          chunk_size: int = CHUNK_SIZE):
+
+    if processes <= 0:
+        return count_chunk_by_length(file_name, start, end)
+
+    tasks = [(file_name, chunk_start, chunk_end)
+             for chunk_start, chunk_end in find_chunks(file_name, chunk_size, start, end)]
+    length_counter = Counter()
+    with Pool(processes) as pool:
+        for partial_counter in pool.imap(_count_chunk_by_length_task, tasks):
+            length_counter.update(partial_counter)
+
+    return length_counter
+
+
+# Pozycja tuż za ostatnim znakiem nowej linii w pliku (0 jeśli go nie ma)
+def last_line_end(file_name: str, file_size: int):
+
+    with open(file_name, 'rb') as file:
+        position = file_size
+        while position > 0:
+            block_start = max(0, position - CHUNK_SIZE)
+            file.seek(block_start)
+            block = file.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            position = block_start
+
+    return 0
+
+
+# Dopisujemy do skrótu bajty pliku z zakresu [start, end), czytane kawałkami
+def update_hash(hasher, file_name: str, start: int, end: int):
+
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            block = file.read(min(CHUNK_SIZE, end - position))
+            if not block:
+                break
+            hasher.update(block)
+            position += len(block)
+
+    return hasher
+
+
+# Wczytujemy indeks z dysku albo tworzymy pusty
+def load_index(index_file: str):
+
+    if not os.path.isfile(index_file):
+        return {}
+
+    with open(index_file, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Zapisujemy indeks na dysk (najpierw do pliku tymczasowego, żeby go nie uszkodzić)
+def save_index(index: dict, index_file: str):
+
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as file:
+        json.dump(index, file, ensure_ascii=False)
+    os.replace(tmp_file, index_file)
+
+
+# Aktualizujemy wpis indeksu dla pliku i zwracamy go
+# Wpis trzyma zliczenia wszystkich słów z pełnych linii, pogrupowane po długości słowa
+def update_index(file_name: str, index_file: str, processes: int = 0):
+
+    index = load_index(index_file)
+    key = os.path.abspath(file_name)
+    stat = os.stat(file_name)
+    entry = index.get(key)
+
+    # Plik się nie zmienił - nic nie liczymy
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        return entry
+
+    # Plik tylko dopisywany - liczymy sam nowy koniec, inaczej wszystko od nowa.
+    # Skrót całej zindeksowanej części wykrywa też zmiany w środku pliku o tym samym rozmiarze
+    hasher = hashlib.sha1()
+    if entry is not None and stat.st_size >= entry['end']:
+        update_hash(hasher, file_name, 0, entry['end'])
+    if (entry is None or stat.st_size < entry['end']
+            or hasher.hexdigest() != entry.get('prefix_hash')):
+        entry = {'end': 0, 'lengths': {}}
+        hasher = hashlib.sha1()
+
+    end = last_line_end(file_name, stat.st_size)
+    length_counter = count_range_by_length(file_name, entry['end'], end, processes)
+    for (length, word), count in length_counter.items():
+        words = entry['lengths'].setdefault(str(length), {})
+        words[word] = words.get(word, 0) + count
+
+    # Skrót przedłużamy o nowy koniec, więc cały plik jest czytany do niego tylko raz
+    update_hash(hasher, file_name, entry['end'], end)
+    entry.update(size=stat.st_size, mtime=stat.st_mtime, end=end, prefix_hash=hasher.hexdigest())
+    index[key] = entry
+    save_index(index, index_file)
+
+    return entry
+
+
+# Odpowiadamy na zapytanie z indeksu - słowa o długości co najmniej word_min_len
+def query_index(file_name: str, entry: dict, word_min_len: int):
+
+    word_counter = Counter()
+    for length, words in entry['lengths'].items():
+        if int(length) >= word_min_len:
+            word_counter.update(words)
+
+    # Ostatnia, niezakończona nową linią linia nie trafia do indeksu, bo dopisanie
+    # danych mogłoby przedłużyć jej ostatnie słowo
+    if entry['end'] < entry['size']:
+        word_counter.update(count_chunk(file_name, entry['end'], entry['size'], word_min_len))
+
+    return word_counter
+
+
+# Wybieramy how_many_words najczęstszych słów kopcem
+def top_words(word_counter: Counter, how_many_words: int):
+    return heapq.nlargest(how_many_words, word_counter.items(), key=itemgetter(1))
+
 
 # Główna funkcja
-def words_in_book(file_name: str, how_many_words: int, word_min_len: int, ignore_words: list):
+def words_in_book(file_name: str, how_many_words: int, word_min_len: int, ignore_words: list,
+                  processes: int = 0, index_file: str = None):
 
     print("You get a histogram of the " + str(how_many_words) +
           " most frequent words, where a word has at least " + str(word_min_len) + " letters.")
 
-    # Czytamy dane
-    with codecs.open(file_name, 'r', 'utf-8') as file:
-        word_list = [word.lower() for line in file for word in line.split()
-                     if (len(word) >= word_min_len and word.isalpha())]
-
-    # Tworzymy countera do zliczania słów
-    word_counter = Counter(word_list)
+    # Czytamy dane (lub indeks) i tworzymy countera do zliczania słów
+    if index_file is not None:
+        entry = update_index(file_name, index_file, processes)
+        word_counter = query_index(file_name, entry, word_min_len)
+    else:
+        word_counter = count_words(file_name, word_min_len, processes)
 
     # Wyrzucamy słowa, które daliśmy jako ignorowane
     if len(ignore_words) > 0:
@@ -39,8 +258,9 @@ def words_in_book(file_name: str, how_many_words: int, word_min_len: int, ignore
                 del word_counter[word]
 
     # Tworzymy listy na słowa i ich zliczenia
-    if len(word_counter.most_common(how_many_words)) > 0:
-        word, popularity = zip(*word_counter.most_common(how_many_words))
+    most_common = top_words(word_counter, how_many_words)
+    if len(most_common) > 0:
+        word, popularity = zip(*most_common)
         word, popularity = list(word), list(popularity)
     else:
         print("Looks like there are not such long words.")
@@ -90,13 +310,15 @@ if __name__ == '__main__':
     try:
         how_many_words = int(sys.argv[2])
         word_min_len = int(sys.argv[3])
+        processes = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+        index_file = str(sys.argv[5]) if len(sys.argv) > 5 else None
     except ValueError:
         print("Error value. Try one more time.")
         sys.exit(0)
 
     # Wywołanie głównej funkcji
     if how_many_words > 0 and word_min_len >= 0:
-        words_in_book(file_name, how_many_words, word_min_len, ignore_words)
+        words_in_book(file_name, how_many_words, word_min_len, ignore_words, processes, index_file)
     else:
         print("Why do you want to use such strange values? Try one more time.")
         sys.exit(0)
@@ -0,0 +1,53 @@
+# Call this script: python benchmark.py
+# Sweep time of the Ising engines against lattice size
+
+from rich.console import Console
+from rich.table import Table
+from lab02 import Ising
+import time
+
+
+# Function to measure mean time of one sweep (size * size attempted flips)
+def sweep_time(size: int, engine: str, sweeps: int):
+
+    ising = Ising(size, 0.7, 0.45, 2.5, sweeps, engine)
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        ising.calculate_new_state()
+    stop = time.perf_counter()
+
+    return (stop - start) / sweeps
+
+
+# Function to run benchmark for every engine and lattice size
+def benchmark(sizes: dict, sweeps: int):
+
+    table = Table(title='Ising sweep time')
+    table.add_column('Size', justify='right')
+    for engine in sizes:
+        table.add_column(f'{engine} (s/sweep)', justify='right')
+
+    all_sizes = sorted({size for engine_sizes in sizes.values() for size in engine_sizes})
+    for size in all_sizes:
+        row = [f'{size}x{size}']
+        for engine, engine_sizes in sizes.items():
+            row.append(f'{sweep_time(size, engine, sweeps):.6f}' if size in engine_sizes else '-')
+        table.add_row(*row)
+
+    return table
+
+
+# MAIN
+if __name__ == '__main__':
+
+    # The full engine is O(size^4) per sweep, so it gets only small lattices
+    sizes = {
+        'local': [8, 16, 32, 64, 128],
+        'full': [8, 16, 32],
+        'checkerboard': [8, 16, 32, 64, 128, 256, 512, 1024, 2048],
+    }
+    # Sweeps per measurement
+    sweeps = 3
+
+    console = Console()
+    console.print(benchmark(sizes, sweeps))
@@ -1,21 +1,102 @@
 # Import dependencies
 import numpy as np
-import random
+import threading
+import queue
 from rich.progress import Progress, BarColumn, TimeElapsedColumn, SpinnerColumn
 from rich.console import Console
 from PIL import Image
+from trajectory import Trajectory
+from observables import Accumulator, correlation_function
+
+
+# Thread saving images in background, so simulation does not wait for PNG encoding
+class ImageWriter(threading.Thread):
+
+    # Constructor, maxsize limits how many frames can wait in memory
+    def __init__(self, maxsize: int = 8):
+        super().__init__(daemon=True)
+        self.frames = queue.Queue(maxsize)
+        self.start()
+
+    # Save queued images until None comes
+    def run(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            image, filename = item
+            image.save(filename)
+
+    # Queue image to save
+    def write(self, image, filename: str):
+        self.frames.put((image, filename))
+
+    # Wait until all queued images are saved
+    def close(self):
+        self.frames.put(None)
+        self.join()
 
 
 class Ising:
 
+    # Available engines to calculate new spins configuration
+    # 'local' - energy change from four neighbours and acceptance table, O(1) per flip
+    # 'full'  - energy of whole frame before and after flip, O(size^2) per flip
+    # 'checkerboard' - NumPy update of all spins of one sublattice at once (even size only)
+    engines = ('local', 'full', 'checkerboard')
+
     # Constructor
-    def __init__(self, size: int, J: float, beta: float, H: float, N: int):
+    def __init__(self, size: int, J: float, beta: float, H: float, N: int, engine: str = 'local',
+                 seed: int = None):
+        if engine not in self.engines:
+            raise ValueError(f'Unknown engine \'{engine}\', choose one of: {", ".join(self.engines)}')
+        # Odd size would put two spins of the same sublattice next to each other across the border
+        if engine == 'checkerboard' and size % 2 != 0:
+            raise ValueError('Checkerboard engine needs an even frame size')
         self.size = size
         self.J = J
         self.beta = beta
         self.H = H
         self.N = N
-        self.frame = np.random.randint(2, size=(size, size)) * 2 - 1
+        self.engine = engine
+        self.rng = np.random.default_rng(seed)
+        # Black sublattice of the checkerboard, white one is its negation
+        self.black = np.indices((size, size)).sum(axis=0) % 2 == 0
+        self.set_frame(self.rng.integers(2, size=(size, size)) * 2 - 1)
+        self.reset_statistics()
+
+    # Set spins configuration and recalculate energy and magnetisation tracked by engines
+    # Engines update self.energy and self.magnetisation with every accepted flip,
+    # so the frame (or J, H) must not be changed in other way than by this method
+    def set_frame(self, frame: np.ndarray):
+        self.frame = frame
+        self.energy = float(self.calculate_energy())
+        self.magnetisation = int(self.calculate_magnetisation())
+
+    # Forget all samples collected by sample()
+    def reset_statistics(self):
+        self.statistics = {
+            'energy': Accumulator(),
+            'magnetisation': Accumulator(),
+            'abs_magnetisation': Accumulator(),
+        }
+        self.correlation = np.zeros((self.size, self.size))
+        self.correlation_samples = 0
+
+    # Add current energy and magnetisation (optionally also correlation function) to statistics
+    def sample(self, correlation: bool = False):
+        self.statistics['energy'].add(self.energy)
+        self.statistics['magnetisation'].add(self.magnetisation)
+        self.statistics['abs_magnetisation'].add(abs(self.magnetisation))
+        if correlation:
+            self.correlation += correlation_function(self.frame)
+            self.correlation_samples += 1
+
+    # Mean spin-spin correlation function of samples
+    def mean_correlation(self):
+        if self.correlation_samples == 0:
+            return self.correlation
+        return self.correlation / self.correlation_samples
 
     # Calculate current magnetisation
     def calculate_magnetisation(self):
@@ -32,33 +113,112 @@ class Ising:
         # Full energy of system
         full_energy = 0
 
-        for i in range(self.size):
-            for j in range(self.size):
+        # Neighbours of every spin at once, shifted with periodic boundaries
+        s_u = np.roll(self.frame, -1, axis=0)
+        s_b = np.roll(self.frame, 1, axis=0)
+        s_l = np.roll(self.frame, 1, axis=1)
+        s_r = np.roll(self.frame, -1, axis=1)
+        s_c = self.frame
 
-                s_u = self.frame[(i + 1) % self.size, j]
-                s_b = self.frame[(i - 1) % self.size, j]
-                s_l = self.frame[i, (j - 1) % self.size]
-                s_r = self.frame[i, (j + 1) % self.size]
-                s_c = self.frame[i, j]
-
-                nodes_energy += (s_u + s_b + s_l + s_r) * s_c
+        nodes_energy = np.sum((s_u + s_b + s_l + s_r) * s_c)
 
         field_energy = -self.H * np.sum(self.frame)
         full_energy = -self.J * nodes_energy + field_energy
         return full_energy
 
+    # Calculate energy change after flip of spin (i, j)
+    def calculate_delta_energy(self, i: int, j: int):
+
+        neighbours = (self.frame[(i + 1) % self.size, j] + self.frame[(i - 1) % self.size, j] +
+                      self.frame[i, (j - 1) % self.size] + self.frame[i, (j + 1) % self.size])
+
+        # Each pair is counted twice in calculate_energy, hence 2 * J
+        return 2 * self.frame[i, j] * (2 * self.J * neighbours + self.H)
+
+    # Calculate acceptance probabilities for every possible energy change
+    # Rows are indexed by spin (-1 -> 0, 1 -> 1), columns by sum of neighbours (-4 -> 0, ..., 4 -> 4)
+    def calculate_acceptance_table(self):
+
+        table = np.empty((2, 5))
+        for row, spin in enumerate((-1, 1)):
+            for col, neighbours in enumerate(range(-4, 5, 2)):
+                delta_energy = 2 * spin * (2 * self.J * neighbours + self.H)
+                table[row, col] = min(1.0, np.exp(-self.beta * delta_energy))
+        return table
+
     # Calculate new spins configuration
     def calculate_new_state(self):
 
+        if self.engine == 'full':
+            self.calculate_new_state_full()
+        elif self.engine == 'checkerboard':
+            self.calculate_new_state_checkerboard()
+        else:
+            self.calculate_new_state_local()
+
+    # Calculate new spins configuration with checkerboard (red/black) sublattice updates
+    def calculate_new_state_checkerboard(self):
+
+        frame = self.frame
+        acceptance = self.calculate_acceptance_table()
+        black = self.black
+
+        # Spins of one sublattice have neighbours only in the other one,
+        # so all of them can be updated at once
+        for sublattice in (black, ~black):
+            neighbours = (np.roll(frame, 1, axis=0) + np.roll(frame, -1, axis=0) +
+                          np.roll(frame, 1, axis=1) + np.roll(frame, -1, axis=1))[sublattice]
+            spins = frame[sublattice]
+            probability = acceptance[(spins + 1) // 2, (neighbours + 4) // 2]
+
+            # One batch of random numbers per half-sweep
+            flip = self.rng.random(spins.size) < probability
+            frame[sublattice] = np.where(flip, -spins, spins)
+
+            # Flipped spins are not neighbours, so their energy changes simply add up
+            flipped = spins[flip]
+            self.energy += float(np.sum(2 * flipped * (2 * self.J * neighbours[flip] + self.H)))
+            self.magnetisation -= 2 * int(np.sum(flipped))
+
+    # Calculate new spins configuration with local energy change
+    def calculate_new_state_local(self):
+
+        size = self.size
+        frame = self.frame
+        acceptance = self.calculate_acceptance_table().tolist()
+
+        # Random numbers of the whole step are drawn at once from self.rng, so seed makes runs reproducible
+        rows, columns = self.rng.integers(size, size=(2, size * size)).tolist()
+        uniforms = self.rng.random(size * size).tolist()
+
         # As many cases as many spins
-        for _ in range(self.size * self.size):
+        for i, j, uniform in zip(rows, columns, uniforms):
+
+            spin = frame[i, j]
+            neighbours = (frame[(i + 1) % size, j] + frame[(i - 1) % size, j] +
+                          frame[i, (j - 1) % size] + frame[i, (j + 1) % size])
+            probability = acceptance[(spin + 1) // 2][(neighbours + 4) // 2]
+
+            # Energy change <= 0 is always accepted, otherwise with Boltzmann probability
+            if probability >= 1.0 or uniform <= probability:
+                frame[i, j] = -spin
+                self.energy += 2 * spin * (2 * self.J * neighbours + self.H)
+                self.magnetisation -= 2 * spin
+
+    # Calculate new spins configuration with full energy recalculation
+    def calculate_new_state_full(self):
+
+        # Random numbers of the whole step are drawn at once from self.rng
+        rows, columns = self.rng.integers(self.size, size=(2, self.size * self.size)).tolist()
+        uniforms = self.rng.random(self.size * self.size).tolist()
+
+        # As many cases as many spins
+        for i, j, uniform in zip(rows, columns, uniforms):
 
             # Calculate old energy without changed spin state
             old_energy = self.calculate_energy()
 
-            # Random choice of spin
-            i = random.randint(0, self.size - 1)
-            j = random.randint(0, self.size - 1)
+            # Random choice of spin is (i, j)
 
             # Change spine state
             self.frame[i, j] = -self.frame[i, j]
@@ -71,43 +231,77 @@ class Ising:
 
             # If energy change > 0, we unaccept spin change when...
             if delta_energy > 0:
-                if random.random() > np.exp(-self.beta * delta_energy):
+                if uniform > np.exp(-self.beta * delta_energy):
                     self.frame[i, j] = -self.frame[i, j]
 
+        # Tracked energy and magnetisation
+        self.set_frame(self.frame)
+
     # Save image with spins
+    # width, height and img are not needed anymore, the image is rendered in one pass by render_image
     def save_image(self, step, arrow_up, arrow_down, width, height, img):
 
         # Each step has own image
         filename = f'step_{step}.png'
-        img.save(filename)
-
-        # For each row and col, save arrow up if 1 or arrow down if -1
-        for i in range(0, self.size):
-            for j in range(0, self.size):
-                out = Image.open(filename)
-                if self.frame[i, j] == 1:
-                    # the second argument here is tuple representing upper left corner
-                    out.paste(arrow_up, (i * width, j * height))
-                else:
-                    out.paste(arrow_down, (i * width, j * height))
-                out.save(filename)
+        arrows = np.stack((np.asarray(arrow_down.convert('RGB')), np.asarray(arrow_up.convert('RGB'))))
+        self.render_image(arrows).save(filename)
+
+    # Read arrows as one array, index 0 is arrow down, index 1 is arrow up
+    @staticmethod
+    def load_arrows(arrow_up_file: str = 'arrow_u.png', arrow_down_file: str = 'arrow_d.png'):
+        arrow_up = np.asarray(Image.open(arrow_up_file).convert('RGB'))
+        arrow_down = np.asarray(Image.open(arrow_down_file).convert('RGB'))
+        return np.stack((arrow_down, arrow_up))
+
+    # Render image with spins in one pass
+    # With arrows each spin is an arrow tile, without them each spin is one pixel (white is up)
+    def render_image(self, arrows: np.ndarray = None):
+
+        # Spin (i, j) goes to column i and row j, the same as in save_image
+        spins = (self.frame.T + 1) // 2
+
+        if arrows is None:
+            return Image.fromarray((spins * 255).astype(np.uint8), 'L')
+
+        _, height, width, channels = arrows.shape
+        tiles = arrows[spins].transpose(0, 2, 1, 3, 4)
+        return Image.fromarray(tiles.reshape(self.size * height, self.size * width, channels), 'RGB')
 
     # Mainly simulation
-    def simulation(self):
+    # image_every - save image every k-th step (0 to save no images)
+    # compact     - save one pixel per spin instead of arrows
+    # trajectory  - name of binary trajectory, the run continues from its last checkpoint if it exists
+    # checkpoint_every - steps between checkpoints of trajectory
+    def simulation(self, image_every: int = 1, compact: bool = False, trajectory: str = None,
+                   checkpoint_every: int = 100):
+
+        # Resume from trajectory, frame k of trajectory is the state after k steps
+        start = 0
+        store = None
+        if trajectory is not None:
+            store = Trajectory(trajectory, self.size, self.J, self.beta, self.H)
+            resumed = store.resume(self.rng)
+            if resumed is not None:
+                start, frame = resumed
+                self.set_frame(frame)
 
         file = open('magnetisation.txt', 'w')
         file.write(
-            f'Frame: {self.size}x{self.size},\tJ = {J},\tBeta = {self.beta},\tH = {self.H}\n')
+            f'Frame: {self.size}x{self.size},\tJ = {self.J},\tBeta = {self.beta},\tH = {self.H}\n')
         file.write('STEP\tMagnetisation\n')
 
-        # Initial magnetisiation
+        # Initial magnetisiation, after resume the last stored one (used if no step is left)
         magnetisation = 0
+        if store is not None:
+            stored = store.column('magnetisation')[:start]
+            for step, value in enumerate(stored):
+                file.write(f'{step}\t{value}\n')
+            if len(stored) > 0:
+                magnetisation = float(stored[-1])
 
-        # Read arrows and create empty image
-        arrow_up = Image.open('arrow_u.png')
-        arrow_down = Image.open('arrow_d.png')
-        width, height = arrow_up.size
-        img = Image.new('RGB', (width * self.size, height * self.size))
+        # Read arrows and start background image writer
+        arrows = None if compact else self.load_arrows()
+        writer = ImageWriter()
 
         # Progress bar customisation
         progress = Progress(
@@ -119,19 +313,30 @@ class Ising:
         )
 
         with progress:
-            task = progress.add_task("Processing..", total=self.N)
-            for step in range(self.N):
+            task = progress.add_task("Processing..", total=self.N, completed=start)
+            for step in range(start, self.N):
                 # Save before calculate new state because we want to have info about initial state
-                self.save_image(step, arrow_up, arrow_down, width, height, img)
-                magnetisation = self.calculate_magnetisation() / (self.size * self.size)
+                if image_every > 0 and step % image_every == 0:
+                    writer.write(self.render_image(arrows), f'step_{step}.png')
+                magnetisation = self.magnetisation / (self.size * self.size)
                 file.write(f'{step}\t{magnetisation}\n')
+                self.sample()
+                if store is not None:
+                    store.append(self.frame, magnetisation, self.energy)
+                    if (step + 1) % checkpoint_every == 0:
+                        store.checkpoint(step + 1, self.rng)
                 # New state
                 self.calculate_new_state()
                 progress.update(task, advance=1)
 
         file.write(f'{self.N}\t{magnetisation}\n')
         file.close()
-        self.save_image(self.N, arrow_up, arrow_down, width, height, img)
+        if store is not None and start <= self.N:
+            store.append(self.frame, self.magnetisation / (self.size * self.size), self.energy)
+            store.checkpoint(self.N + 1, self.rng)
+        if image_every > 0:
+            writer.write(self.render_image(arrows), f'step_{self.N}.png')
+        writer.close()
 
 
 # MAIN
@@ -0,0 +1,76 @@
+# Running statistics of observables sampled during the Ising simulation
+
+import numpy as np
+
+
+# Running mean and variance (Welford) with binning analysis for autocorrelation time
+# Level k holds means of blocks of 2^k consecutive samples, memory is O(levels)
+class Accumulator:
+
+    # Constructor
+    # min_blocks - the highest level used for error and autocorrelation needs at least this many blocks
+    def __init__(self, levels: int = 40, min_blocks: int = 32):
+        self.min_blocks = min_blocks
+        self.count = [0] * levels
+        self.means = [0.0] * levels
+        self.m2 = [0.0] * levels
+        self.pending = [None] * levels
+
+    # Add one sample
+    def add(self, value: float):
+        for level in range(len(self.count)):
+            self.count[level] += 1
+            delta = value - self.means[level]
+            self.means[level] += delta / self.count[level]
+            self.m2[level] += delta * (value - self.means[level])
+
+            # Two neighbouring blocks make one block of the next level
+            if self.pending[level] is None:
+                self.pending[level] = value
+                break
+            value = 0.5 * (self.pending[level] + value)
+            self.pending[level] = None
+
+    # Number of samples
+    @property
+    def samples(self):
+        return self.count[0]
+
+    @property
+    def mean(self):
+        return self.means[0]
+
+    # Sample variance at given level
+    def variance(self, level: int = 0):
+        if self.count[level] < 2:
+            return 0.0
+        return self.m2[level] / (self.count[level] - 1)
+
+    # The highest level with enough blocks
+    def block_level(self):
+        level = 0
+        while level + 1 < len(self.count) and self.count[level + 1] >= self.min_blocks:
+            level += 1
+        return level
+
+    # Error of mean from blocked samples, correct also for correlated samples
+    def error(self):
+        level = self.block_level()
+        if self.count[level] < 2:
+            return 0.0
+        return np.sqrt(self.variance(level) / self.count[level])
+
+    # Integrated autocorrelation time in samples, 0.5 for uncorrelated samples
+    def autocorrelation_time(self):
+        naive = self.variance(0) / self.count[0] if self.count[0] > 1 else 0.0
+        if naive == 0.0:
+            return 0.5
+        return 0.5 * self.error() ** 2 / naive
+
+
+# Connected spin-spin correlation function <s(r0) s(r0 + r)> - <s>^2 for periodic frame
+# Calculated with FFT, element [di, dj] is the correlation at distance (di, dj)
+def correlation_function(frame: np.ndarray):
+    spins = frame - frame.mean()
+    transform = np.fft.rfft2(spins)
+    return np.fft.irfft2(transform * np.conj(transform), s=frame.shape) / frame.size
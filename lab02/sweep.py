@@ -0,0 +1,149 @@
+# Call this script: python sweep.py [filename.csv]
+# Runs the Ising model for a grid of J, beta and H values on all cores
+# and writes one table with mean observables per point
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from rich.console import Console
+from sys import argv
+from lab02 import Ising
+import numpy as np
+import csv
+
+
+# Columns of the output table
+COLUMNS = ['J', 'beta', 'H', 'size', 'magnetisation', 'abs_magnetisation',
+           'energy', 'energy_error', 'susceptibility', 'specific_heat',
+           'tau_magnetisation', 'tau_energy', 'swap_rate']
+
+
+# Function to reduce statistics of sampled magnetisation and energy of whole frame to observables per spin
+def observables(ising: Ising):
+
+    spins = ising.size * ising.size
+    M = ising.statistics['magnetisation']
+    E = ising.statistics['energy']
+
+    return {
+        'J': ising.J,
+        'beta': float(ising.beta),
+        'H': ising.H,
+        'size': ising.size,
+        'magnetisation': M.mean / spins,
+        'abs_magnetisation': ising.statistics['abs_magnetisation'].mean / spins,
+        'energy': E.mean / spins,
+        'energy_error': float(E.error() / spins),
+        'susceptibility': ising.beta * M.variance() / spins,
+        'specific_heat': ising.beta * ising.beta * E.variance() / spins,
+        'tau_magnetisation': float(M.autocorrelation_time()),
+        'tau_energy': float(E.autocorrelation_time()),
+    }
+
+
+# Function to simulate one (J, beta, H) point
+def run_point(J: float, beta: float, H: float, size: int, thermalisation: int, samples: int,
+              engine: str, seed):
+
+    ising = Ising(size, J, beta, H, thermalisation + samples, engine, seed)
+
+    for step in range(thermalisation + samples):
+        ising.calculate_new_state()
+        if step >= thermalisation:
+            ising.sample()
+
+    return [observables(ising)]
+
+
+# Function to simulate a ladder of beta values with replica exchange (parallel tempering)
+# After every sweep neighbouring replicas try to swap configurations
+def run_tempering(J: float, betas: list, H: float, size: int, thermalisation: int, samples: int,
+                  engine: str, seed):
+
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(2 ** 63, size=len(betas))
+    replicas = [Ising(size, J, beta, H, thermalisation + samples, engine, replica_seed)
+                for beta, replica_seed in zip(sorted(betas), seeds)]
+    swaps = np.zeros(len(replicas))
+    attempts = np.zeros(len(replicas))
+
+    for step in range(thermalisation + samples):
+        for ising in replicas:
+            ising.calculate_new_state()
+
+        # Even and odd pairs alternate, so every pair is tried every second sweep
+        for k in range(step % 2, len(replicas) - 1, 2):
+            first, second = replicas[k], replicas[k + 1]
+            attempts[k] += 1
+            delta = (first.beta - second.beta) * (first.energy - second.energy)
+            if delta >= 0 or rng.random() < np.exp(delta):
+                # Replicas share J and H, so tracked energy and magnetisation go with the frame
+                first.frame, second.frame = second.frame, first.frame
+                first.energy, second.energy = second.energy, first.energy
+                first.magnetisation, second.magnetisation = second.magnetisation, first.magnetisation
+                swaps[k] += 1
+
+        if step >= thermalisation:
+            for ising in replicas:
+                ising.sample()
+
+    rows = []
+    for k, ising in enumerate(replicas):
+        row = observables(ising)
+        # Swap rate with the next (higher beta) replica
+        row['swap_rate'] = swaps[k] / attempts[k] if attempts[k] > 0 else ''
+        rows.append(row)
+    return rows
+
+
+# Function to run the whole grid in a process pool
+# With tempering every (J, H) pair is one task holding the whole beta ladder
+def sweep(Js: list, betas: list, Hs: list, size: int, thermalisation: int, samples: int,
+          engine: str = 'checkerboard', tempering: bool = False, processes: int = None, seed: int = None):
+
+    if tempering:
+        tasks = [(run_tempering, J, betas, H) for J, H in product(Js, Hs)]
+    else:
+        tasks = [(run_point, J, beta, H) for J, beta, H in product(Js, betas, Hs)]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(function, J, beta, H, size, thermalisation, samples, engine, task_seed)
+                   for (function, J, beta, H), task_seed in zip(tasks, seeds)]
+        rows = [row for future in futures for row in future.result()]
+
+    return sorted(rows, key=lambda row: (row['J'], row['H'], row['beta']))
+
+
+# Function to save table to .csv file
+def save_table(rows: list, filename: str):
+
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# MAIN
+if __name__ == '__main__':
+
+    filename = argv[1] if len(argv) > 1 else 'phase_diagram.csv'
+
+    # Frame size
+    size = 32
+    # Exchange integrals
+    Js = [1.0]
+    # Temperatures, calculate_energy counts every pair twice, so the transition is near beta = 0.22 / J
+    betas = list(np.linspace(0.15, 0.3, 13))
+    # Field values
+    Hs = [0.0, 0.05, 0.1]
+    # Sweeps before and during measurement
+    thermalisation = 500
+    samples = 2000
+    # Swap neighbouring temperatures
+    tempering = True
+
+    console = Console()
+    console.print(f'[bold green]Frame: {size}x{size}, {len(Js) * len(betas) * len(Hs)} points')
+    rows = sweep(Js, betas, Hs, size, thermalisation, samples, tempering=tempering, seed=2021)
+    save_table(rows, filename)
+    console.print(f'[bold green]Saved table to file \'{filename}\'')
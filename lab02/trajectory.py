@@ -0,0 +1,138 @@
+# Compact binary trajectory of the Ising simulation with checkpoint/resume
+#
+# Files for trajectory 'name':
+# name.spins         - header (JSON padded to HEADER_SIZE bytes) and spin frames, 1 bit per spin
+# name.magnetisation - float64 column, magnetisation per spin for each frame
+# name.energy        - float64 column, energy of whole frame for each frame
+#
+# Frames and observables are only appended. The header says how many frames are
+# complete (checkpoint), everything after that is dropped when the run is resumed.
+
+import numpy as np
+import random
+import json
+import os
+
+
+# Header size in bytes, large enough for the Mersenne Twister state of module random
+HEADER_SIZE = 16384
+# Format marker saved in header
+MAGIC = 'ising-trajectory-1'
+# Observable columns
+COLUMNS = ('magnetisation', 'energy')
+
+
+class Trajectory:
+
+    # Constructor, opens existing trajectory or creates new one for given frame size and parameters
+    def __init__(self, name: str, size: int, J: float, beta: float, H: float):
+        self.name = name
+        self.size = size
+        self.frame_bytes = (size * size + 7) // 8
+        self.header = {'magic': MAGIC, 'size': size, 'J': J, 'beta': beta, 'H': H,
+                       'steps': 0, 'rng_state': None, 'random_state': None}
+
+        if os.path.exists(self.spins_file):
+            header = self.read_header()
+            for key in ('size', 'J', 'beta', 'H'):
+                if header[key] != self.header[key]:
+                    raise ValueError(f'Trajectory \'{name}\' has {key} = {header[key]}, '
+                                     f'not {self.header[key]}')
+            self.header = header
+        else:
+            self.write_header()
+
+        # Drop frames written after the last checkpoint
+        self.truncate(self.header['steps'])
+
+    @property
+    def spins_file(self):
+        return f'{self.name}.spins'
+
+    # File with given observable column
+    def column_file(self, column: str):
+        return f'{self.name}.{column}'
+
+    # Number of complete frames (the last checkpoint)
+    @property
+    def steps(self):
+        return self.header['steps']
+
+    def read_header(self):
+        with open(self.spins_file, 'rb') as file:
+            header = json.loads(file.read(HEADER_SIZE).decode('utf-8'))
+        if header.get('magic') != MAGIC:
+            raise ValueError(f'\'{self.spins_file}\' is not an Ising trajectory')
+        return header
+
+    # Header is rewritten in place, it has always the same size
+    def write_header(self):
+        data = json.dumps(self.header).encode('utf-8')
+        if len(data) > HEADER_SIZE:
+            raise ValueError('Trajectory header is too large')
+        mode = 'r+b' if os.path.exists(self.spins_file) else 'wb'
+        with open(self.spins_file, mode) as file:
+            file.write(data.ljust(HEADER_SIZE))
+            file.flush()
+            os.fsync(file.fileno())
+
+    # Cut files to given number of frames
+    def truncate(self, steps: int):
+        with open(self.spins_file, 'r+b') as file:
+            file.truncate(HEADER_SIZE + steps * self.frame_bytes)
+        for column in COLUMNS:
+            with open(self.column_file(column), 'ab') as file:
+                file.truncate(steps * np.dtype(np.float64).itemsize)
+
+    # Append one frame with its observables
+    def append(self, frame: np.ndarray, magnetisation: float, energy: float):
+        with open(self.spins_file, 'ab') as file:
+            file.write(np.packbits(frame.ravel() > 0).tobytes())
+        for column, value in zip(COLUMNS, (magnetisation, energy)):
+            with open(self.column_file(column), 'ab') as file:
+                file.write(np.float64(value).tobytes())
+
+    # Mark all appended frames as complete and save RNG states needed to continue after the last one
+    def checkpoint(self, steps: int, rng: np.random.Generator):
+        for filename in [self.spins_file] + [self.column_file(column) for column in COLUMNS]:
+            with open(filename, 'rb+') as file:
+                os.fsync(file.fileno())
+        version, state, gauss = random.getstate()
+        self.header.update(steps=steps, rng_state=rng.bit_generator.state,
+                           random_state=[version, list(state), gauss])
+        self.write_header()
+
+    # Restore RNG states from the last checkpoint and return (step, frame) to continue from
+    # RNG states were saved right after the last frame was appended, so that frame is dropped
+    # and appended again by the resumed run. Returns None if there is no checkpoint.
+    def resume(self, rng: np.random.Generator):
+        if self.header['rng_state'] is None:
+            return None
+        rng.bit_generator.state = self.header['rng_state']
+        version, state, gauss = self.header['random_state']
+        random.setstate((version, tuple(state), gauss))
+
+        step = self.steps - 1
+        frame = self.frame(step)
+        self.header['steps'] = step
+        self.truncate(step)
+        return step, frame
+
+    # All frames as memory-mapped packed bits, shape (steps, frame_bytes)
+    def packed_frames(self):
+        # Empty file can not be memory-mapped
+        if self.steps == 0:
+            return np.empty((0, self.frame_bytes), dtype=np.uint8)
+        return np.memmap(self.spins_file, dtype=np.uint8, mode='r', offset=HEADER_SIZE,
+                         shape=(self.steps, self.frame_bytes))
+
+    # Frame with given index as array of +1/-1 spins
+    def frame(self, step: int):
+        bits = np.unpackbits(self.packed_frames()[step], count=self.size * self.size)
+        return bits.reshape(self.size, self.size).astype(np.int64) * 2 - 1
+
+    # Observable column as memory-mapped array
+    def column(self, column: str):
+        if self.steps == 0:
+            return np.empty(0, dtype=np.float64)
+        return np.memmap(self.column_file(column), dtype=np.float64, mode='r', shape=(self.steps,))
@@ -0,0 +1,62 @@
+# Call this script: python benchmark_parsing.py [page.html ...]
+# Time of reading book fields with full BeautifulSoup tree against lxml with precompiled selectors
+# Without arguments saved pages from fixtures are used, padded with unrelated markup to the size of
+# a real book page (comments, recommendations, scripts take most of it)
+
+from glob import glob
+from sys import argv
+from os import path
+from lab03 import parse_book, parse_book_fast, parse_books
+import time
+import os
+
+
+# Function to add unrelated markup (about size bytes) before the end of page body
+def pad_page(page: bytes, size: int):
+
+    block = (b'<div class="comment"><div class="comment__author"><a href="/profil/1">reader</a></div>'
+             b'<p class="comment__text">Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>'
+             b'<ul class="rating"><li>1</li><li>2</li><li>3</li></ul></div>\n')
+    return page.replace(b'</body>', block * (size // len(block)) + b'</body>')
+
+
+# Function to measure time of parsing all pages
+def measure(function, pages: list):
+
+    start = time.perf_counter()
+    books = [function(page) for page in pages]
+    stop = time.perf_counter()
+
+    return stop - start, books
+
+
+# MAIN
+if __name__ == '__main__':
+
+    filenames = argv[1:] or glob(path.join(path.dirname(path.abspath(__file__)), 'fixtures', '*.html'))
+    saved = []
+    for filename in filenames:
+        with open(filename, 'rb') as file:
+            saved.append(file.read())
+    if len(argv) == 1:
+        saved = [pad_page(page, 300_000) for page in saved]
+    # Repeat saved pages to have a batch
+    pages = (saved * (50 // len(saved) + 1))[:50]
+    processes = os.cpu_count()
+
+    print(f'{len(pages)} pages, {sum(len(page) for page in pages) / 2**20:.2f} MiB')
+    print(f'{"method":>28}{"time [s]":>12}{"pages/s":>12}{"speedup":>10}')
+    reference, expected = measure(parse_book, pages)
+    for name, function in [
+        ('full soup (lxml)', parse_book),
+        ('lxml selectors', parse_book_fast),
+        (f'lxml selectors, {processes} processes', lambda batch: parse_books(batch, processes)),
+    ]:
+        if name.endswith('processes'):
+            start = time.perf_counter()
+            books = function(pages)
+            elapsed = time.perf_counter() - start
+        else:
+            elapsed, books = measure(function, pages)
+        assert books == expected, f'{name} read other fields'
+        print(f'{name:>28}{elapsed:>12.4f}{len(pages) / elapsed:>12.1f}{reference / elapsed:>9.1f}x')
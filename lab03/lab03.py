@@ -1,44 +1,203 @@
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+from hashlib import sha256
 from sys import argv
 from os import path
 import requests
 import json
+import os
+
+
+# Address of a book page, {} is replaced by book ID
+BOOK_URL = 'https://lubimyczytac.pl/ksiazka/{}'
+# Directory of the on-disk HTTP cache
+CACHE_DIR = '.http_cache'
+# Keys of the scraped fields
+KEYS = ['Autor', 'Tytuł', 'Cykl', 'Kategoria', 'Strony', 'Opis']
+
+
+# XPath of an element with given class among others, like BeautifulSoup class_='name'
+def has_class(name: str):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+# Precompiled selectors of parse_book_fast, the first match of each is the field,
+# multi-word classes are compared with the whole attribute, like BeautifulSoup does
+SELECTORS = [etree.XPath(selector) for selector in [
+    f'(//a[{has_class("link-name")}])[1]',
+    f'(//h1[{has_class("book__title")}])[1]',
+    '(//span[@class="d-none d-sm-block mt-1"])[1]/a[1]',
+    '(//a[@class="book__category d-sm-block d-none"])[1]',
+    '(//span[@class="d-sm-inline-block book-pages book__pages pr-2 mr-2 pr-sm-3 mr-sm-3"])[1]',
+    f'(//div[{has_class("collapse-content")}])[1]',
+]]
+
+
+# On-disk HTTP cache, every url has body file <hash>.html and metadata file <hash>.json
+# with ETag and Last-Modified, which are sent back as a conditional request
+class HttpCache:
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, extension: str):
+        return path.join(self.directory, sha256(url.encode()).hexdigest() + extension)
+
+    # Function to return headers of conditional request for url (empty if url is not cached)
+    def conditional_headers(self, url: str):
+
+        try:
+            with open(self._path(url, '.json'), 'r') as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        return headers
+
+    # Function to read cached body of url
+    def load(self, url: str):
+        with open(self._path(url, '.html'), 'rb') as file:
+            return file.read()
+
+    # Function to save response, files are replaced atomically so parallel downloads never see half of it
+    def store(self, url: str, response: requests.Response):
+
+        metadata = {'url': url, 'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')}
+        if not metadata['etag'] and not metadata['last_modified']:
+            return
+
+        for extension, content in (('.html', response.content), ('.json', json.dumps(metadata).encode())):
+            target = self._path(url, extension)
+            temporary = f'{target}.{os.getpid()}.{id(response)}.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, target)
+
+
+# Function to create session with connection pool for given number of workers
+def make_session(workers: int = 1):
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Function to change book ID to its url, urls are returned unchanged
+def book_url(entry: str, url_format: str = BOOK_URL):
+    return entry if '://' in entry else url_format.format(entry)
+
+
+# Function to download page, cached copy is used when server answers 304 Not Modified
+# Returns page bytes (decoded by the parser, which also reads <meta charset>) and True if they
+# came from cache, raises requests.HTTPError on failure
+def fetch(session: requests.Session, url: str, cache: HttpCache = None, timeout: float = 30):
+
+    headers = cache.conditional_headers(url) if cache is not None else {}
+    response = session.get(url, headers=headers, timeout=timeout)
+
+    if response.status_code == requests.codes.not_modified and headers:
+        try:
+            return cache.load(url), True
+        except OSError:
+            # Body was removed from cache, download it again without condition
+            response = session.get(url, timeout=timeout)
+
+    response.raise_for_status()
+    if cache is not None:
+        cache.store(url, response)
+    return response.content, False
+
+
+# Function to read book information from page (text or bytes), returns dictionary with KEYS
+def parse_book(page):
+
+    soup = BeautifulSoup(page, 'lxml')
+
+    # author
+    author = soup.find('a', class_='link-name').text.strip()
+    # title
+    title = soup.find(
+        'h1', class_='book__title').text.strip()
+    # cycle
+    cycle = soup.find(
+        'span', class_='d-none d-sm-block mt-1').a.text.strip()
+    # category
+    category = soup.find(
+        'a', class_='book__category d-sm-block d-none').text.strip()
+    # pages
+    pages = soup.find(
+        'span', class_='d-sm-inline-block book-pages book__pages pr-2 mr-2 pr-sm-3 mr-sm-3').text.strip().split()[0]
+    # description
+    description = soup.find(
+        'div', class_='collapse-content').text.strip()  # book description
+
+    # Create dictionary
+    values = [author, title, cycle, category, pages, description]
+    return dict(zip(KEYS, values))
+
+
+# Function to read the same dictionary as parse_book with lxml and precompiled selectors
+# The page is parsed straight into lxml tree without building BeautifulSoup objects, several times faster
+def parse_book_fast(page):
+
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+    tree = lxml.html.fromstring(page)
+
+    values = []
+    for selector in SELECTORS:
+        elements = selector(tree)
+        if not elements:
+            raise AttributeError(f'No element matches {selector.path}')
+        values.append(elements[0].text_content().strip())
+    # Only the number of pages
+    values[4] = values[4].split()[0]
+
+    return dict(zip(KEYS, values))
+
+
+# Function to parse downloaded record in worker process, page is replaced by book fields or error
+def parse_record(record: dict):
+
+    page = record.pop('page', None)
+    if page is None:
+        return record
+    try:
+        return {**record, **parse_book_fast(page)}
+    except (AttributeError, IndexError, etree.ParserError) as error:
+        return {**record, 'error': f'{type(error).__name__}: {error}'}
+
+
+# Function to parse many pages in process pool, results in the order of pages
+def parse_books(pages, processes: int = None, chunksize: int = 8):
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(parse_book_fast, pages, chunksize=chunksize))
 
 
 # Function to scraping 'The Way of Kings' from polish site - lubimyczytac.pl
 def book_scraping(filename: str):
 
     url = 'https://lubimyczytac.pl/ksiazka/4896952/droga-krolow'
-    response = requests.get(url)
 
-    # Was the query successful
-    if response.status_code != requests.codes.ok:
+    try:
+        page, _ = fetch(make_session(), url, HttpCache())
+    except requests.RequestException:
         print('Something has gone wrong!')
     else:
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        # author
-        author = soup.find('a', class_='link-name').text.strip()
-        # title
-        title = soup.find(
-            'h1', class_='book__title').text.strip()
-        # cycle
-        cycle = soup.find(
-            'span', class_='d-none d-sm-block mt-1').a.text.strip()
-        # category
-        category = soup.find(
-            'a', class_='book__category d-sm-block d-none').text.strip()
-        # pages
-        pages = soup.find(
-            'span', class_='d-sm-inline-block book-pages book__pages pr-2 mr-2 pr-sm-3 mr-sm-3').text.strip().split()[0]
-        # description
-        description = soup.find(
-            'div', class_='collapse-content').text.strip()  # book description
-
-        # Create dictionary
-        keys = ['Autor', 'Tytuł', 'Cykl', 'Kategoria', 'Strony', 'Opis']
-        values = [author, title, cycle, category, pages, description]
-        dictionary = dict(zip(keys, values))
+        dictionary = parse_book(page)
 
         # Save dictionary to .json file with indent
         with open(filename, 'w', encoding='utf-8') as file:
@@ -46,14 +205,76 @@ def book_scraping(filename: str):
         print(f'Saved information to file \'{filename}\'')
 
 
+# Function to download one book in worker thread, returns record with page or error
+def download_book(session: requests.Session, cache: HttpCache, url: str):
+
+    try:
+        page, cached = fetch(session, url, cache)
+        return {'url': url, 'cached': cached, 'page': page}
+    except requests.RequestException as error:
+        return {'url': url, 'error': f'{type(error).__name__}: {error}'}
+
+
+# Function to scrape many books (IDs or urls) with shared session and at most workers requests at once
+# Every book is one line of JSON Lines file, in the order of entries, returns number of failed books
+# With processes > 0 pages are parsed in process pool while the next ones are still downloaded
+def scrape_books(entries: list, filename: str, workers: int = 8, cache_dir: str = CACHE_DIR,
+                 url_format: str = BOOK_URL, processes: int = 0):
+
+    cache = HttpCache(cache_dir)
+    urls = [book_url(entry, url_format) for entry in entries]
+    failed = 0
+
+    # Pools are closed also when fetching or parsing fails, so no worker process is left behind
+    with make_session(workers) as session, ThreadPoolExecutor(workers) as pool, \
+            ProcessPoolExecutor(processes) if processes else nullcontext() as parsers, \
+            open(filename, 'w', encoding='utf-8') as file:
+        downloads = pool.map(lambda url: download_book(session, cache, url), urls)
+        if processes:
+            records = parsers.map(parse_record, downloads, chunksize=4)
+        else:
+            records = map(parse_record, downloads)
+
+        for record in records:
+            failed += 'error' in record
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    print(f'Saved information about {len(urls) - failed} of {len(urls)} books to file \'{filename}\'')
+    return failed
+
+
+# Function to read book IDs or urls, one per line, empty lines and lines starting with '#' are skipped
+def read_entries(filename: str):
+    with open(filename, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+
 # MAIN
 if __name__ == '__main__':
 
+    # Batch mode, url format may point to local server, e.g. 'http://localhost:8000/{}.html'
+    # serving saved pages: python -m http.server --directory fixtures
+    if len(argv) > 1 and argv[1] == '--batch':
+        try:
+            entries = read_entries(argv[2])
+            filename = argv[3]
+            workers = int(argv[4]) if len(argv) > 4 else 8
+            url_format = argv[5] if len(argv) > 5 else BOOK_URL
+            processes = int(argv[6]) if len(argv) > 6 else 0
+        except (IndexError, ValueError, OSError):
+            print(f'Usage: {path.basename(__file__)} --batch <books.txt> <filename.jsonl> [workers] [url_format] '
+                  f'[processes]')
+            exit(1)
+
+        exit(1 if scrape_books(entries, filename, workers, url_format=url_format, processes=processes) else 0)
+
     # simple protection
     try:
         filename = argv[1]
     except IndexError:
         print(f'Usage: {path.basename(__file__)} <filename.json>')
+        print(f'       {path.basename(__file__)} --batch <books.txt> <filename.jsonl> [workers] [url_format] '
+              f'[processes]')
         exit(1)
 
     book_scraping(filename)
@@ -0,0 +1,178 @@
+# Concurrent, deduplicating and resumable download of images found by lab04
+#
+# Images are stored by content: every file is named by SHA-256 of its bytes, so identical images
+# (the same picture under several links) are stored once. The manifest maps ID{n} keys of the links
+# JSON to url, stored file, size and hash, it is saved after every finished download, so an interrupted
+# run loses nothing. Links whose url is in the manifest of the previous run (under any ID, IDs change between
+# searches), with its file still present with matching size and hash, are not downloaded again.
+#
+# Test against local server: python -m http.server --directory <images> 8000, and a links JSON
+# with 'http://localhost:8000/<image>' addresses, then python downloader.py <links.json> <directory>
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from hashlib import sha256
+from sys import argv
+import mimetypes
+import requests
+import json
+import os
+
+
+# Name of the manifest in the images directory
+MANIFEST = 'manifest.json'
+# Size of streamed parts of images
+CHUNK_SIZE = 64 * 1024
+
+
+# Function to calculate SHA-256 of file
+def file_hash(path: str):
+
+    digest = sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to read manifest of previous run, empty if there is none
+def load_manifest(directory: str):
+
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Function to save manifest with temporary file and atomic rename
+def save_manifest(directory: str, manifest: dict):
+
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+# Function to check if manifest entry of url points to an intact file (the file is named by content hash)
+def is_stored(directory: str, entry: dict, url: str):
+
+    if not entry or entry.get('url') != url or 'file' not in entry:
+        return False
+    path = os.path.join(directory, entry['file'])
+    return (os.path.isfile(path) and os.path.getsize(path) == entry['size']
+            and file_hash(path) == entry['sha256'])
+
+
+# Function to find entry of previous manifest with intact file of url, first under the same key,
+# then under any other key with the same url, returns None if there is none
+def find_stored(directory: str, previous: dict, key: str, url: str):
+
+    candidates = [previous.get(key)] + [entry for other, entry in previous.items()
+                                        if other != key and entry.get('url') == url]
+    for entry in candidates:
+        if is_stored(directory, entry, url):
+            return entry
+    return None
+
+
+# Function to stream image to temporary file and rename it to its hash, returns manifest entry
+def download_image(session: requests.Session, url: str, directory: str, key: str, timeout: float = 30):
+
+    temporary = os.path.join(directory, f'.{key}.part')
+    digest = sha256()
+    size = 0
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            with open(temporary, 'wb') as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+
+        # Images from the site are mostly jpg, it is also the extension of unknown types
+        extension = mimetypes.guess_extension(content_type) or '.jpg'
+        if extension == '.jpe':
+            extension = '.jpg'
+        name = digest.hexdigest() + extension
+        target = os.path.join(directory, name)
+        if os.path.isfile(target) and os.path.getsize(target) == size:
+            # The same image was already stored
+            os.remove(temporary)
+        else:
+            os.replace(temporary, target)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    return {'url': url, 'file': name, 'size': size, 'sha256': digest.hexdigest()}
+
+
+# Function to download images from dictionary {ID{n}: url} to directory with at most workers at once
+# Returns manifest, failed downloads have 'error' instead of file
+def download_images(dictionary: dict, directory: str, workers: int = 8):
+
+    os.makedirs(directory, exist_ok=True)
+    previous = load_manifest(directory)
+    # Entries of the previous run stay until their keys are done, so an interrupted run keeps them
+    manifest = dict(previous)
+    skipped = 0
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    # Function to get manifest entry of one link in worker thread
+    def get(item):
+        key, url = item
+        entry = find_stored(directory, previous, key, url)
+        if entry is not None:
+            return key, dict(entry), True
+        try:
+            return key, download_image(session, url, directory, key), False
+        except (requests.RequestException, OSError) as error:
+            return key, {'url': url, 'error': f'{type(error).__name__}: {error}'}, False
+
+    try:
+        with session, ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(get, item) for item in dictionary.items()]
+            try:
+                for future in as_completed(futures):
+                    key, entry, was_stored = future.result()
+                    manifest[key] = entry
+                    skipped += was_stored
+                    save_manifest(directory, manifest)
+            except BaseException:
+                # Downloads which did not start yet are not waited for
+                pool.shutdown(cancel_futures=True)
+                raise
+        # Keys which are not links anymore are dropped only after a complete run
+        manifest = {key: manifest[key] for key in dictionary}
+    finally:
+        save_manifest(directory, manifest)
+
+    stored = {entry['file'] for entry in manifest.values() if 'file' in entry}
+    failed = sum('error' in entry for entry in manifest.values())
+    print(f'{len(dictionary)} links: {len(stored)} unique images, {skipped} already stored, {failed} failed')
+
+    return manifest
+
+
+# MAIN
+if __name__ == '__main__':
+
+    # simple protection
+    try:
+        filename = argv[1]
+        directory = argv[2]
+        workers = int(argv[3]) if len(argv) > 3 else 8
+    except (IndexError, ValueError):
+        print(f'Usage: {os.path.basename(__file__)} <filename.json> <directory> [workers]')
+        exit(1)
+
+    with open(filename, 'r', encoding='utf-8') as file:
+        download_images(json.load(file), directory, workers)
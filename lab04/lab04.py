@@ -7,7 +7,7 @@ from selenium.webdriver.chrome.service import Service
 import sys
 import json
 import os
-import wget
+from downloader import download_images
 
 
 # Function to scrape DevianArt with selenium and download images to directory
@@ -48,20 +48,8 @@ def scrape_and_save(search_name: str, filename: str):
         json.dump(dictionary, file, ensure_ascii=False, indent=4)
         print(f'Saved information to file \'{filename}\'')
 
-    # Create directory with name search_name
-    path = os.getcwd()
-    path = os.path.join(path, search_name)
-    try:
-        os.mkdir(path)
-    except:
-        pass
-
-    # Save images to directory
-    counter = 1
-    for link in links:
-        save = os.path.join(path, f'{counter}.jpg')
-        wget.download(link, save)
-        counter += 1
+    # Download images to directory with name search_name, manifest.json there maps ids to stored files
+    download_images(dictionary, os.path.join(os.getcwd(), search_name))
 
 
 # MAIN
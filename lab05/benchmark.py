@@ -0,0 +1,78 @@
+# Call this script: python benchmark.py
+# Load time of language counts and latency of slider callback, the previous approach (Counter loop,
+# most_common and new ColumnDataSource on every slider move) against one split of joined responses
+# with pre-sorted arrays and in-place patches of the source
+
+from bokeh.models import ColumnDataSource
+from bokeh.plotting import figure
+from bokeh.document import Document
+from collections import Counter
+from lab05 import load_lang_data, process_data, top_factors, update_plot
+import pandas as pd
+import numpy as np
+import time
+
+
+# Previous load_lang_data, empty responses are skipped (they crashed it)
+def load_lang_data_counter(filename: str = "data-03.csv"):
+
+    data_lang = pd.read_csv(filename)
+    language_counter = Counter()
+    for response in data_lang["LanguagesWorkedWith"].dropna():
+        language_counter.update(response.split(";"))
+
+    return language_counter
+
+
+# Previous slider callback: sort counter again and replace all data of the source
+def update_counter(new: int, language_counter: Counter, source: ColumnDataSource, plot):
+
+    language, popularity = zip(*language_counter.most_common(new))
+    language = tuple(reversed(language))
+    popularity = tuple(reversed(popularity))
+    new_source = ColumnDataSource(dict(x=popularity, y=language))
+    source.data = dict(new_source.data)
+    plot.y_range.factors = new_source.data['y']
+
+
+# Function to return mean time in ms of repeated calls
+def mean_time(function, repeat: int):
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        function(i)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+# MAIN
+if __name__ == '__main__':
+
+    repeat = 5
+    counter_load = mean_time(lambda _: load_lang_data_counter(), repeat)
+    vectorized_load = mean_time(lambda _: load_lang_data(), repeat)
+
+    language_counter = load_lang_data_counter()
+    languages, counts = load_lang_data()
+    assert dict(language_counter) == dict(zip(languages, counts.tolist())), 'counts differ'
+
+    # Slider moves between 10 and 20 like on the dashboard, every callback sends events to the document
+    values = [10 + (i * 7) % 11 for i in range(1001)]
+    moves = list(zip(values[:-1], values[1:]))
+
+    source = ColumnDataSource(dict(x=[], y=[]))
+    plot = figure(y_range=[])
+    plot.hbar(right='x', y='y', source=source, height=0.4)
+    Document().add_root(plot)
+    update_counter(values[0], language_counter, source, plot)
+    counter_callback = mean_time(lambda i: update_counter(moves[i][1], language_counter, source, plot), len(moves))
+
+    source = process_data(values[0], languages, counts, 20)
+    plot = figure(y_range=top_factors(values[0], languages))
+    plot.hbar(right='x', y='y', source=source, height=0.4)
+    Document().add_root(plot)
+    patch_callback = mean_time(lambda i: update_plot(*moves[i], languages, counts, source, plot), len(moves))
+
+    print(f'{"":>24}{"previous [ms]":>16}{"lab05 [ms]":>14}{"speedup":>10}')
+    print(f'{"load counts":>24}{counter_load:>16.2f}{vectorized_load:>14.2f}{counter_load / vectorized_load:>9.1f}x')
+    print(f'{"slider callback":>24}{counter_callback:>16.3f}{patch_callback:>14.3f}'
+          f'{counter_callback / patch_callback:>9.1f}x')
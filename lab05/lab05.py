@@ -33,67 +33,85 @@ def age_histogram():
 
 
 # Function to load data about responders languages from csv
-def load_lang_data():
+# Returns arrays of languages and their counts, sorted from the most popular
+def load_lang_data(filename: str = "data-03.csv"):
 
     # load data about languages from csv
-    data_lang = pd.read_csv("data-03.csv")
+    data_lang = pd.read_csv(filename, usecols=["LanguagesWorkedWith"])
     lang_responses = data_lang["LanguagesWorkedWith"]
-    language_counter = Counter()
 
-    # count responses
-    for response in lang_responses:
-        language_counter.update(response.split(";"))
+    # count responses: all of them are joined into one text (empty, NaN responses are skipped),
+    # which is split once, so there is no Python loop over responses
+    language_counter = Counter(lang_responses.str.cat(sep=";").split(";"))
+    # sort by count, languages with the same count by name
+    ranking = sorted(language_counter.items(), key=lambda item: (-item[1], item[0]))
 
-    return language_counter
+    return np.array([language for language, _ in ranking]), np.array([count for _, count in ranking])
 
 
 # Function to process data
-def process_data(slider_value: int, language_counter: Counter):
+# Source has rows for the largest slider value, the most popular first, rows below slider value have zero bars
+def process_data(slider_value: int, languages: np.ndarray, counts: np.ndarray, rows: int):
 
-    # counter.most_common returns list of tuples so we unzip it
-    language, popularity = zip(*language_counter.most_common(slider_value))
-    # and reverse because we want the most popular at the top
-    language = tuple(reversed(language))
-    popularity = tuple(reversed(popularity))
+    popularity = np.where(np.arange(rows) < slider_value, counts[:rows], 0)
     # create source to bokeh
-    source = ColumnDataSource(dict(x=popularity, y=language))
+    source = ColumnDataSource(dict(x=popularity, y=languages[:rows]))
 
     return source
 
 
-# Fuction to reload data on dashboard
-def update_data(attr, old, new):
-
-    new_source = process_data(new, language_counter)
-    source.data = dict(new_source.data)
-    plot.y_range.factors = new_source.data['y']
-
-
-# ---------------------------------------------------------------------------
-# Initial slider value
-slider_value = 10
-language_counter = load_lang_data()
-source = process_data(slider_value, language_counter)
-
-# Slider
-offset = Slider(title='Top Languages', value=10, start=10,
-                end=20, step=1)
-offset.on_change('value', update_data)
-
-# Plot
-plot = figure(y_range=source.data['y'], background_fill_color="#fafafa")
-plot.hbar(right='x', y='y', source=source,
-          height=0.4, color='blue', fill_alpha=0.5)
-plot.title.text = 'Most popular languages according to Stackoverflow in 2019'
-plot.title.align = 'center'
-plot.title.text_color = 'black'
-plot.title.text_font_size = '15px'
-plot.xaxis.axis_label = 'Number of people using this'
-# ---------------------------------------------------------------------------
-# Histogram
-hist_plot = age_histogram()
-# ---------------------------------------------------------------------------
-
-# Curdoc
-curdoc().add_root(row(hist_plot, plot, offset, width=900))
-curdoc().title = 'Stackoverflow Poll'
+# Function to return y axis factors of top languages, reversed because we want the most popular at the top
+def top_factors(slider_value: int, languages: np.ndarray):
+    return languages[:slider_value][::-1].tolist()
+
+
+# Function to move slider of dashboard from old to new value, shared by the dashboard and benchmark.py
+# Only rows between old and new slider value are patched in place, the source is never rebuilt
+def update_plot(old: int, new: int, languages: np.ndarray, counts: np.ndarray, source: ColumnDataSource, plot):
+
+    low, high = sorted((old, new))
+    popularity = counts[low:high] if new > old else np.zeros(high - low, dtype=counts.dtype)
+    source.patch({'x': [(slice(low, high), popularity.tolist())]})
+    plot.y_range.factors = top_factors(new, languages)
+
+
+# Function to build dashboard in document
+def dashboard(doc):
+
+    # ---------------------------------------------------------------------------
+    # Initial slider value
+    slider_value = 10
+    languages, counts = load_lang_data()
+
+    # Fuction to reload data on dashboard
+    def update_data(attr, old, new):
+        update_plot(old, new, languages, counts, source, plot)
+
+    # Slider
+    offset = Slider(title='Top Languages', value=10, start=10,
+                    end=min(20, len(languages)), step=1)
+    offset.on_change('value', update_data)
+    source = process_data(slider_value, languages, counts, offset.end)
+
+    # Plot
+    plot = figure(y_range=top_factors(slider_value, languages), background_fill_color="#fafafa")
+    plot.hbar(right='x', y='y', source=source,
+              height=0.4, color='blue', fill_alpha=0.5)
+    plot.title.text = 'Most popular languages according to Stackoverflow in 2019'
+    plot.title.align = 'center'
+    plot.title.text_color = 'black'
+    plot.title.text_font_size = '15px'
+    plot.xaxis.axis_label = 'Number of people using this'
+    # ---------------------------------------------------------------------------
+    # Histogram
+    hist_plot = age_histogram()
+    # ---------------------------------------------------------------------------
+
+    # Curdoc
+    doc.add_root(row(hist_plot, plot, offset, width=900))
+    doc.title = 'Stackoverflow Poll'
+
+
+# bokeh serve runs this file as module bokeh_app_<id>, importing it (e.g. in benchmark.py) builds nothing
+if __name__ == '__main__' or __name__.startswith('bokeh_app_'):
+    dashboard(curdoc())
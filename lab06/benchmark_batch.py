@@ -0,0 +1,45 @@
+# Call this script: python benchmark_batch.py
+# Time of the batched ensemble kernel against separate runs of sim_loop_inplace for growing ensembles
+# Members are all combinations of initial states ns and drive strengths Ks, other parameters from parameters_py.txt
+
+from lab06 import read_parameters, simulate, simulate_batch
+from itertools import product
+import numpy as np
+import time
+
+
+# MAIN
+if __name__ == '__main__':
+
+    N, _, m, omega, _, t, tau, _, _ = read_parameters()
+    # Time steps of every run
+    S = 20000
+    S_out = 100
+    # Ensembles of initial states and drive strengths
+    ensembles = [
+        ([1, 2], [1.0, 2.0]),
+        ([1, 2, 3, 4], [1.0, 2.0, 4.0, 8.0]),
+        ([1, 2, 3, 4, 5, 6, 7, 8], [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]),
+    ]
+
+    # Compile before measuring
+    simulate(N, 1, m, omega, 1.0, t, tau, 1, 1)
+    simulate_batch(N, [1], m, omega, [1.0], t, tau, 1, 1)
+
+    print(f'N = {N}, S = {S}, S_out = {S_out}')
+    print(f'{"members":>8}{"separate [s]":>14}{"batched [s]":>14}{"speedup":>10}{"max difference":>16}')
+    for ns, Ks in ensembles:
+        members = list(product(ns, Ks))
+
+        start = time.perf_counter()
+        separate = [simulate(N, n, m, omega, K, t, tau, S, S_out)[1:] for n, K in members]
+        separate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, norm, x_mean, energy = simulate_batch(N, [n for n, _ in members], m, omega, [K for _, K in members],
+                                                 t, tau, S, S_out)
+        batched_time = time.perf_counter() - start
+
+        difference = max(np.max(np.abs(np.array(a) - b)) for a, b in zip(zip(*separate), (norm, x_mean, energy)))
+        print(f'{len(members):>8}{separate_time:>14.4f}{batched_time:>14.4f}{separate_time / batched_time:>9.1f}x'
+              f'{difference:>16.2e}')
@@ -0,0 +1,47 @@
+# Call this script: python benchmark_propagators.py
+# Accuracy against wall time of the propagators for parameters from parameters_py.txt
+# Reference is the split-operator run with a very small time step
+
+from lab06 import read_parameters, simulate
+import numpy as np
+import time
+
+
+# Function to run one propagator until time T with ten outputs, returns wall time and observables
+def run(parameters: list, propagator: str, tau: float, T: float):
+
+    N, n, m, omega, K, t, _, _, _ = parameters
+    S = int(round(T / tau))
+    start = time.perf_counter()
+    _, norm, x_mean, energy = simulate(N, n, m, omega, K, t, tau, S, S // 10, propagator=propagator)
+    stop = time.perf_counter()
+
+    return stop - start, norm, x_mean, energy
+
+
+# MAIN
+if __name__ == '__main__':
+
+    parameters = list(read_parameters())
+    # Simulated time
+    T = 1.0
+    # Time steps of each propagator (T / tau divisible by 10), the leapfrog scheme is unstable above about dx^2
+    taus = {
+        'leapfrog': [1e-4, 5e-5, 2e-5, 1e-5],
+        'crank-nicolson': [1e-2, 5e-3, 2e-3, 1e-3, 5e-4, 2e-4, 1e-4],
+        'split-operator': [1e-2, 5e-3, 2e-3, 1e-3, 5e-4, 2e-4, 1e-4],
+    }
+
+    # Compile all kernels before measuring
+    for propagator in taus:
+        run(parameters, propagator, 0.1, 1.0)
+
+    _, _, x_ref, energy_ref = run(parameters, 'split-operator', 1e-5, T)
+
+    print(f'N = {parameters[0]}, T = {T}, reference: split-operator with tau = 1e-5')
+    print(f'{"propagator":>16}{"tau":>10}{"time [s]":>12}{"|norm - 1|":>14}{"x mean error":>14}{"energy error":>14}')
+    for propagator, propagator_taus in taus.items():
+        for tau in propagator_taus:
+            wall_time, norm, x_mean, energy = run(parameters, propagator, tau, T)
+            print(f'{propagator:>16}{tau:>10.0e}{wall_time:>12.4f}{np.max(np.abs(norm[1:] - 1)):>14.2e}'
+                  f'{np.max(np.abs(x_mean[1:] - x_ref[1:])):>14.2e}{np.max(np.abs(energy[1:] - energy_ref[1:])):>14.2e}')
@@ -0,0 +1,16 @@
+# Call this script: python build_aot.py
+# Builds extension module lab06_aot with ahead-of-time compiled sim_loop and sim_loop_inplace,
+# lab06.main uses it instead of the JIT versions when it can be imported
+
+from numba.pycc import CC
+from lab06 import sim_loop, sim_loop_inplace, SIM_LOOP_SIGNATURE
+
+
+# MAIN
+if __name__ == '__main__':
+
+    cc = CC('lab06_aot')
+    cc.export('sim_loop', SIM_LOOP_SIGNATURE)(sim_loop.py_func)
+    cc.export('sim_loop_inplace', SIM_LOOP_SIGNATURE)(sim_loop_inplace.py_func)
+    cc.compile()
+    print(f'Built module \'{cc.name}\' in {cc.output_dir}')
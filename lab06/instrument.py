@@ -0,0 +1,202 @@
+# Timing and profiling instrumentation for hot functions of the labs
+#
+# Timer works as a decorator or as a context manager:
+#
+#   @Timer(repeat=10, warmup=1)          # every call runs the function 1 + 10 times,
+#   def sweep(...): ...                  # returns the result of the last run and prints statistics
+#
+#   timer = Timer('download', profile='tracemalloc', output='timings.jsonl')
+#   for url in urls:
+#       with timer:                      # every block is one sample, the first warmup blocks are skipped
+#           download(url)
+#   timer.print_report(); timer.save()
+#
+# Times are measured with perf_counter_ns. Reports are dictionaries with the samples, min, max, mean,
+# median, standard deviation and percentiles in seconds, saved as JSON lines (one report per line).
+# profile='cprofile' adds the functions with the largest cumulative time, profile='tracemalloc' adds
+# the peak of memory allocated by Python during the measured runs. Warm-up runs are never profiled.
+
+from functools import wraps
+from statistics import mean, median, stdev
+import cProfile
+import json
+import pstats
+import time
+import tracemalloc
+
+
+# Profilers which may be given as profile argument
+PROFILERS = (None, 'cprofile', 'tracemalloc')
+
+
+# Function to calculate percentile p (0-100) of sorted values with linear interpolation
+def percentile(values: list, p: float):
+
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Timer:
+
+    def __init__(self, name: str = None, repeat: int = 1, warmup: int = 0, profile: str = None,
+                 output: str = None, percentiles: tuple = (5, 25, 75, 95, 99), top: int = 20,
+                 verbose: bool = True):
+
+        if profile not in PROFILERS:
+            raise ValueError(f'Unknown profiler \'{profile}\', use one of {PROFILERS}')
+        if repeat < 1 or warmup < 0:
+            raise ValueError('repeat must be positive and warmup not negative')
+
+        self.name = name
+        self.repeat = repeat
+        self.warmup = warmup
+        self.profile = profile
+        self.output = output
+        self.percentiles = percentiles
+        # Number of functions in cProfile report
+        self.top = top
+        self.verbose = verbose
+        self.reset()
+
+    # Forget samples and profiles, next context manager blocks start with warm-up again
+    def reset(self):
+
+        self.samples = []
+        self.entries = 0
+        self.profiler = cProfile.Profile() if self.profile == 'cprofile' else None
+        self.peak_memory = 0
+        self.start = None
+
+    def _start_profile(self):
+
+        if self.profile == 'cprofile':
+            self.profiler.enable()
+        elif self.profile == 'tracemalloc':
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def _stop_profile(self):
+
+        if self.profile == 'cprofile':
+            self.profiler.disable()
+        elif self.profile == 'tracemalloc':
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    # Function to run func once, measured runs are timed and profiled
+    def _run(self, measured: bool, func, *args, **kwargs):
+
+        if not measured:
+            return func(*args, **kwargs)
+
+        self._start_profile()
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stop = time.perf_counter_ns()
+            self._stop_profile()
+            self.samples.append(stop - start)
+
+    # Decorator, every call of func runs warmup + repeat times with fresh statistics
+    def __call__(self, func):
+
+        if self.name is None:
+            self.name = func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+
+            self.reset()
+            for _ in range(self.warmup):
+                self._run(False, func, *args, **kwargs)
+            for _ in range(self.repeat):
+                result = self._run(True, func, *args, **kwargs)
+            self.finish()
+            return result
+
+        wrapper.timer = self
+        return wrapper
+
+    # Context manager, every block is one sample
+    def __enter__(self):
+
+        self.entries += 1
+        if self.entries > self.warmup:
+            self._start_profile()
+            self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        if self.start is not None:
+            stop = time.perf_counter_ns()
+            self._stop_profile()
+            self.samples.append(stop - self.start)
+            self.start = None
+        return False
+
+    # Print and save report after decorated calls
+    def finish(self):
+
+        if self.verbose:
+            self.print_report()
+        if self.output is not None:
+            self.save()
+
+    # Function to create dictionary with statistics of measured samples, times in seconds
+    def report(self):
+
+        seconds = sorted(sample / 1e9 for sample in self.samples)
+        report = {
+            'name': self.name,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'warmup': self.warmup,
+            'runs': len(seconds),
+            'samples': [sample / 1e9 for sample in self.samples],
+        }
+        if seconds:
+            report.update({
+                'min': seconds[0],
+                'max': seconds[-1],
+                'mean': mean(seconds),
+                'median': median(seconds),
+                'stdev': stdev(seconds) if len(seconds) > 1 else 0.0,
+                'percentiles': {str(p): percentile(seconds, p) for p in self.percentiles},
+            })
+
+        if self.profile == 'tracemalloc':
+            report['peak_memory'] = self.peak_memory
+        elif self.profile == 'cprofile' and seconds:
+            stats = pstats.Stats(self.profiler)
+            report['profile'] = [
+                {'function': f'{filename}:{line}({function})', 'calls': calls, 'total': total,
+                 'cumulative': cumulative}
+                for (filename, line, function), (_, calls, total, cumulative, _) in
+                sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+            ]
+
+        return report
+
+    # Function to append report to JSON lines file
+    def save(self, filename: str = None):
+
+        with open(filename or self.output, 'a') as file:
+            file.write(json.dumps(self.report()) + '\n')
+
+    def print_report(self):
+
+        report = self.report()
+        if report['runs'] == 0:
+            print(f'{report["name"]}: no measured runs')
+        elif report['runs'] == 1:
+            print(f'{report["name"]} execution time: {report["min"]:.5f} sec.')
+        else:
+            print(f'{report["name"]} execution time over {report["runs"]} runs: min {report["min"]:.5f}, '
+                  f'median {report["median"]:.5f}, stdev {report["stdev"]:.5f} sec.')
+        if 'peak_memory' in report:
+            print(f'{report["name"]} peak memory: {report["peak_memory"] / 2**20:.3f} MiB')
+        for entry in report.get('profile', [])[:5]:
+            print(f'  {entry["cumulative"]:>10.5f} sec. {entry["calls"]:>8} calls  {entry["function"]}')
@@ -2,53 +2,33 @@ import numpy as np
 import matplotlib.pyplot as plt
 import time
 from numba import jit
-from functools import wraps
-from statistics import mean
+from instrument import Timer
+
+# sim_loop kernels are compiled when the module is imported and cached on disk in __pycache__,
+# so the next runs only load them and timings of main do not include compilation
+compile_start = time.perf_counter()
+
+# Signature of sim_loop kernels, also used by build_aot.py
+SIM_LOOP_SIGNATURE = ('void(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], '
+                      'float64[:], int64, int64, float64[:], float64, float64, float64, float64, float64)')
+# Signature of sim_loop_batch, the same with 2-D arrays and W, K for every ensemble member
+# (C-contiguous, so the loops over members vectorise)
+SIM_LOOP_BATCH_SIGNATURE = ('void(float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], '
+                            'float64[:, ::1], float64[:, ::1], float64[:, ::1], int64, int64, float64[::1], '
+                            'float64, float64, float64[::1], float64, float64[::1])')
 
 
 # This decorator may be launched with or without parameters
 # The default runtime will give the function execution time
 # You can also specify the number of times the function is repeated
-# Then you get average execution time
+# Then you get min, median and standard deviation of execution time
+# Other options are passed to Timer (warmup, profile, output, ...), see instrument.py
 def my_timer(*args_timer, **kwargs_timer):
-
-    # Default option without arguments
-    if len(args_timer) == 0 and len(kwargs_timer) == 0:
-        def decorator(my_func):
-
-            @wraps(my_func)
-            def wrapper(*args_func, **kwargs_func):
-                start = time.time()
-                my_func(*args_func, **kwargs_func)
-                stop = time.time()
-                print(
-                    f'{my_func.__name__} execution time: {(stop - start):.5f} sec.')
-
-            return wrapper
-        return decorator
-
-    # Main option with arguments
-    else:
-        def decorator(my_func):
-            times_table = []
-
-            @wraps(my_func)
-            def wrapper(*args_func, **kwargs_func):
-
-                for _ in range(*args_timer):
-                    start = time.time()
-                    my_func(*args_func, **kwargs_func)
-                    stop = time.time()
-                    times_table.append(stop - start)
-                print(
-                    f'{my_func.__name__} average execution time: {mean(times_table):.5f} sec.')
-
-            return wrapper
-        return decorator
+    return Timer(repeat=args_timer[0] if args_timer else 1, **kwargs_timer)
 
 
 # Function it is compiled to machine code “just-in-time”
-@jit(nopython=True, fastmath=True)
+@jit(SIM_LOOP_SIGNATURE, nopython=True, fastmath=True, cache=True)
 def sim_loop(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K):
 
     for i in range(1, S + 1):
@@ -69,13 +49,275 @@ def sim_loop(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau,
 
         if i % S_out == 0:
 
-            k = int(i / 1000)
+            k = i // S_out
             norm[k] = np.sum(dx * (Psi_R * Psi_R + Psi_I * Psi_I))
             x_mean[k] = np.sum(dx * x * (Psi_R * Psi_R + Psi_I * Psi_I))
             energy[k] = np.sum(dx * (Psi_R * H_R + Psi_I * H_I))
 
 
-def draw_plot(times, x_mean, energy):
+# In-place version of sim_loop, the same interface and the same scheme
+# Psi_R, Psi_I, H_R and H_I are updated in place with explicit loops, so no array is
+# allocated in the time loop, and the driving factor K * sin(W * time) is calculated
+# once per step (both half steps use the same time). Observable k is saved after
+# step k * S_out into norm, x_mean and energy, which may be memory-mapped
+@jit(SIM_LOOP_SIGNATURE, nopython=True, fastmath=True, cache=True)
+def sim_loop_inplace(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K):
+
+    size = Psi_R.shape[0]
+    laplace = -0.5 / (dx * dx)
+    half_tau = 0.5 * tau
+
+    for i in range(1, S + 1):
+
+        drive = K * np.sin(W * (t + i * tau))
+
+        for j in range(size):
+            Psi_R[j] += H_I[j] * half_tau
+
+        for j in range(1, size - 1):
+            H_R[j] = laplace * (Psi_R[j - 1] + Psi_R[j + 1] - 2 * Psi_R[j]) + \
+                drive * (x[j] - 0.5) * Psi_R[j]
+
+        for j in range(size):
+            Psi_I[j] -= H_R[j] * tau
+
+        for j in range(1, size - 1):
+            H_I[j] = laplace * (Psi_I[j - 1] + Psi_I[j + 1] - 2 * Psi_I[j]) + \
+                drive * (x[j] - 0.5) * Psi_I[j]
+
+        for j in range(size):
+            Psi_R[j] += H_I[j] * half_tau
+
+        if i % S_out == 0:
+
+            k = i // S_out
+            norm_sum = 0.0
+            x_sum = 0.0
+            energy_sum = 0.0
+            for j in range(size):
+                density = Psi_R[j] * Psi_R[j] + Psi_I[j] * Psi_I[j]
+                norm_sum += density
+                x_sum += x[j] * density
+                energy_sum += Psi_R[j] * H_R[j] + Psi_I[j] * H_I[j]
+            norm[k] = dx * norm_sum
+            x_mean[k] = dx * x_sum
+            energy[k] = dx * energy_sum
+
+
+# Hamiltonian operator actions on the wave function, H_R and H_I are filled in place
+@jit(nopython=True, fastmath=True, cache=True)
+def apply_hamiltonian(Psi_R, Psi_I, H_R, H_I, x, dx, drive):
+
+    laplace = -0.5 / (dx * dx)
+    for j in range(1, Psi_R.shape[0] - 1):
+        H_R[j] = laplace * (Psi_R[j - 1] + Psi_R[j + 1] - 2 * Psi_R[j]) + drive * (x[j] - 0.5) * Psi_R[j]
+        H_I[j] = laplace * (Psi_I[j - 1] + Psi_I[j + 1] - 2 * Psi_I[j]) + drive * (x[j] - 0.5) * Psi_I[j]
+
+
+# Save norm, mean position and energy as observable k
+@jit(nopython=True, fastmath=True, cache=True)
+def save_observables(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, k, x, dx):
+
+    norm_sum = 0.0
+    x_sum = 0.0
+    energy_sum = 0.0
+    for j in range(Psi_R.shape[0]):
+        density = Psi_R[j] * Psi_R[j] + Psi_I[j] * Psi_I[j]
+        norm_sum += density
+        x_sum += x[j] * density
+        energy_sum += Psi_R[j] * H_R[j] + Psi_I[j] * H_I[j]
+    norm[k] = dx * norm_sum
+    x_mean[k] = dx * x_sum
+    energy[k] = dx * energy_sum
+
+
+# Batched version of sim_loop_inplace for an ensemble of wave functions
+# Arrays are grid x ensemble: column e of Psi_R, Psi_I, H_R and H_I is one member with its own
+# W[e] and K[e], row e of norm, x_mean and energy gets its observables. Members are the inner,
+# contiguous axis, so one stencil point is updated for the whole ensemble with SIMD instructions,
+# and the driving factors of all members are calculated once per step
+@jit(SIM_LOOP_BATCH_SIGNATURE, nopython=True, fastmath=True, cache=True)
+def sim_loop_batch(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K):
+
+    size, members = Psi_R.shape
+    laplace = -0.5 / (dx * dx)
+    half_tau = 0.5 * tau
+    drive = np.empty(members)
+    norm_sum = np.empty(members)
+    x_sum = np.empty(members)
+    energy_sum = np.empty(members)
+
+    for i in range(1, S + 1):
+
+        for e in range(members):
+            drive[e] = K[e] * np.sin(W[e] * (t + i * tau))
+
+        for j in range(size):
+            for e in range(members):
+                Psi_R[j, e] += H_I[j, e] * half_tau
+
+        for j in range(1, size - 1):
+            potential = x[j] - 0.5
+            for e in range(members):
+                H_R[j, e] = laplace * (Psi_R[j - 1, e] + Psi_R[j + 1, e] - 2 * Psi_R[j, e]) + \
+                    drive[e] * potential * Psi_R[j, e]
+
+        for j in range(size):
+            for e in range(members):
+                Psi_I[j, e] -= H_R[j, e] * tau
+
+        for j in range(1, size - 1):
+            potential = x[j] - 0.5
+            for e in range(members):
+                H_I[j, e] = laplace * (Psi_I[j - 1, e] + Psi_I[j + 1, e] - 2 * Psi_I[j, e]) + \
+                    drive[e] * potential * Psi_I[j, e]
+
+        for j in range(size):
+            for e in range(members):
+                Psi_R[j, e] += H_I[j, e] * half_tau
+
+        if i % S_out == 0:
+
+            k = i // S_out
+            norm_sum[:] = 0.0
+            x_sum[:] = 0.0
+            energy_sum[:] = 0.0
+            for j in range(size):
+                for e in range(members):
+                    density = Psi_R[j, e] * Psi_R[j, e] + Psi_I[j, e] * Psi_I[j, e]
+                    norm_sum[e] += density
+                    x_sum[e] += x[j] * density
+                    energy_sum[e] += Psi_R[j, e] * H_R[j, e] + Psi_I[j, e] * H_I[j, e]
+            for e in range(members):
+                norm[e, k] = dx * norm_sum[e]
+                x_mean[e, k] = dx * x_sum[e]
+                energy[e, k] = dx * energy_sum[e]
+
+
+# Crank-Nicolson propagator, the same interface as sim_loop
+# (1 + i H tau / 2) Psi(t + tau) = (1 - i H tau / 2) Psi(t) with H at the middle of the step,
+# the tridiagonal system is solved with the Thomas algorithm. The scheme is unitary and stable
+# for any tau, so tau is limited only by accuracy. Boundary values of Psi stay fixed
+@jit(SIM_LOOP_SIGNATURE, nopython=True, fastmath=True, cache=True)
+def sim_loop_crank_nicolson(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K):
+
+    size = Psi_R.shape[0]
+    off = -0.5 / (dx * dx)
+    a = 0.5j * tau
+
+    # Work arrays are allocated once
+    psi = Psi_R + 1j * Psi_I
+    diag = np.empty(size)
+    rhs = np.empty(size, dtype=np.complex128)
+    c_prime = np.empty(size, dtype=np.complex128)
+
+    for i in range(1, S + 1):
+
+        drive = K * np.sin(W * (t + (i - 0.5) * tau))
+
+        for j in range(1, size - 1):
+            diag[j] = -2 * off + drive * (x[j] - 0.5)
+            rhs[j] = psi[j] - a * (diag[j] * psi[j] + off * (psi[j - 1] + psi[j + 1]))
+
+        # Forward sweep, sub- and super-diagonal are both a * off
+        lower = a * off
+        c_prime[1] = lower / (1 + a * diag[1])
+        rhs[1] = rhs[1] / (1 + a * diag[1])
+        for j in range(2, size - 1):
+            denominator = 1 + a * diag[j] - lower * c_prime[j - 1]
+            c_prime[j] = lower / denominator
+            rhs[j] = (rhs[j] - lower * rhs[j - 1]) / denominator
+
+        # Back substitution
+        psi[size - 2] = rhs[size - 2]
+        for j in range(size - 3, 0, -1):
+            psi[j] = rhs[j] - c_prime[j] * psi[j + 1]
+
+        if i % S_out == 0:
+            for j in range(size):
+                Psi_R[j] = psi[j].real
+                Psi_I[j] = psi[j].imag
+            apply_hamiltonian(Psi_R, Psi_I, H_R, H_I, x, dx, K * np.sin(W * (t + i * tau)))
+            save_observables(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, i // S_out, x, dx)
+
+    for j in range(size):
+        Psi_R[j] = psi[j].real
+        Psi_I[j] = psi[j].imag
+    apply_hamiltonian(Psi_R, Psi_I, H_R, H_I, x, dx, K * np.sin(W * (t + S * tau)))
+
+
+compile_time = time.perf_counter() - compile_start
+
+# Optional ahead-of-time compiled sim_loop, build it with: python build_aot.py
+try:
+    import lab06_aot
+except ImportError:
+    lab06_aot = None
+
+
+# Discrete sine transform (DST-I) of interior values u through FFT of the odd extension in work
+# work has length 2 * (len(u) + 1), its elements 0 and len(u) + 1 must be zero
+def sine_transform(u, work):
+
+    n = u.shape[0]
+    work[1:n + 1] = u
+    work[n + 2:] = -u[::-1]
+    return np.fft.fft(work)[1:n + 1] * 0.5j
+
+
+# Split-operator propagator, the same interface as sim_loop
+# exp(-i V tau / 2) exp(-i T tau) exp(-i V tau / 2) with V at the middle of the step.
+# The kinetic part is diagonal in the sine basis of the box, its eigenvalues are taken from
+# the same finite difference Laplacian as in sim_loop, so only the time step error differs.
+# The scheme is unitary and stable for any tau
+def sim_loop_split(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K):
+
+    N = Psi_R.shape[0] - 1
+    modes = np.arange(1, N)
+    kinetic_phase = np.exp(-1j * tau * (1 - np.cos(modes * np.pi / N)) / (dx * dx))
+    potential = x[1:-1] - 0.5
+    work = np.zeros(2 * N, dtype=complex)
+    psi = Psi_R[1:-1] + 1j * Psi_I[1:-1]
+
+    for i in range(1, S + 1):
+
+        half_step = np.exp(-0.5j * tau * K * np.sin(W * (t + (i - 0.5) * tau)) * potential)
+        psi *= half_step
+        psi = sine_transform(kinetic_phase * sine_transform(psi, work), work) * (2.0 / N)
+        psi *= half_step
+
+        if i % S_out == 0:
+            Psi_R[1:-1] = psi.real
+            Psi_I[1:-1] = psi.imag
+            apply_hamiltonian(Psi_R, Psi_I, H_R, H_I, x, dx, K * np.sin(W * (t + i * tau)))
+            save_observables(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, i // S_out, x, dx)
+
+    Psi_R[1:-1] = psi.real
+    Psi_I[1:-1] = psi.imag
+    apply_hamiltonian(Psi_R, Psi_I, H_R, H_I, x, dx, K * np.sin(W * (t + S * tau)))
+
+
+# Available propagators, all with the interface of sim_loop
+propagators = {
+    'leapfrog': sim_loop_inplace,
+    'split-operator': sim_loop_split,
+    'crank-nicolson': sim_loop_crank_nicolson,
+}
+
+
+# Arrays for k observables: norm, x_mean and energy
+# With filename they are rows of one memory-mapped .npy file, so long runs do not need to fit in memory
+def make_output(k: int, filename: str = None):
+
+    if filename is None:
+        output = np.empty((3, k), dtype=float)
+    else:
+        output = np.lib.format.open_memmap(filename, mode='w+', dtype=float, shape=(3, k))
+
+    return output[0], output[1], output[2]
+
+
+def draw_plot(times, x_mean, energy, filename: str = 'quantum.png'):
 
     plt.style.use("bmh")
 
@@ -94,14 +336,14 @@ def draw_plot(times, x_mean, energy):
     ax2.set_xlabel("Time", fontname="Times New Roman")
     ax2.set_ylabel("Energy", fontname="Times New Roman")
 
-    fig.savefig('quantum.png', dpi=200)
+    fig.savefig(filename, dpi=200)
+    plt.close(fig)
 
 
-@my_timer(2)
-def main():
-    # ----------------------------------------------------------------
-    # Read data from file
-    with open("parameters_py.txt", "r") as f:
+# Read parameters N, n, m, omega, K, t, tau, S, S_out from file
+def read_parameters(filename: str = 'parameters_py.txt'):
+
+    with open(filename, "r") as f:
         data = f.read()
 
     # We take only values
@@ -109,10 +351,14 @@ def main():
     data = data[0::2]
 
     # Change types to int or float
-    data = (int(i) if i.isdigit() else float(i) for i in data)
+    return tuple(int(i) if i.isdigit() else float(i) for i in data)
+
 
-    # Unzip values to variables
-    N, n, m, omega, K, t, tau, S, S_out = data
+# Run one simulation, returns times and observables
+# With output the observables are written to memory-mapped .npy file
+# propagator - one of propagators, the explicit leapfrog scheme needs tau < dx^2
+def simulate(N, n, m, omega, K, t, tau, S, S_out, output: str = None, propagator: str = 'leapfrog'):
+    # ----------------------------------------------------------------
     PI = np.pi
     W = omega * 0.01 * abs(m * m - n * n) * PI * PI * 0.5
     # ----------------------------------------------------------------
@@ -152,10 +398,8 @@ def main():
     # ----------------------------------------------------------------
     # Simulation
     # Arrays to plots
-    k = int(S / S_out) + 1
-    norm = np.empty(k, dtype=float)
-    x_mean = np.empty(k, dtype=float)
-    energy = np.empty(k, dtype=float)
+    k = S // S_out + 1
+    norm, x_mean, energy = make_output(k, output)
     times = np.linspace(0, 50, k, dtype=float)
 
     # Zero-element is a initial information
@@ -164,18 +408,77 @@ def main():
     energy[0] = energy_0
 
     # Simulation loop
-    sim_loop(Psi_R, Psi_I, H_R, H_I, norm, x_mean,
-             energy, S, S_out, x, dx, tau, W, t, K)
+    if propagator not in propagators:
+        raise ValueError(f'Unknown propagator \'{propagator}\', choose one of: {", ".join(propagators)}')
+    loop = propagators[propagator]
+    if propagator == 'leapfrog' and lab06_aot is not None:
+        loop = lab06_aot.sim_loop_inplace
+    loop(Psi_R, Psi_I, H_R, H_I, norm, x_mean,
+         energy, S, S_out, x, dx, tau, W, t, K)
     # ----------------------------------------------------------------
 
-    # ----------------------------------------------------------------
+    return times, norm, x_mean, energy
+
+
+# Run simulations of an ensemble of initial states ns and drive strengths Ks at once
+# All members share N, m, omega, t, tau, S and S_out, returns times and observables, shape (members, k)
+# Scalar Ks is the same drive strength for every member
+def simulate_batch(N, ns, m, omega, Ks, t, tau, S, S_out):
+
+    PI = np.pi
+    ns = np.atleast_1d(np.asarray(ns))
+    members = len(ns)
+    K = np.asarray(Ks, dtype=float)
+    if K.ndim == 0:
+        K = np.full(members, float(K))
+    # The kernel does not check bounds, so every member needs its own K
+    if K.shape != (members,):
+        raise ValueError(f'Ks must be a scalar or have one value per member of ns ({members}), '
+                         f'got shape {K.shape}')
+    K = np.ascontiguousarray(K)
+    W = omega * 0.01 * np.abs(m * m - ns * ns) * PI * PI * 0.5
+
+    # Initial conditions, grid x ensemble
+    x = np.linspace(0, 1, N + 1, dtype=float)
+    dx = 1.0 / N
+    Psi_R = np.ascontiguousarray(np.sqrt(2) * np.sin(np.outer(PI * x, ns)))
+    Psi_I = np.zeros((N + 1, members), dtype=float)
+    H_R = np.zeros((N + 1, members), dtype=float)
+    H_I = np.zeros((N + 1, members), dtype=float)
+
+    k = S // S_out + 1
+    norm = np.empty((members, k), dtype=float)
+    x_mean = np.empty((members, k), dtype=float)
+    energy = np.empty((members, k), dtype=float)
+    times = np.linspace(0, 50, k, dtype=float)
+
+    # Zero-element is a initial information
+    for e in range(members):
+        Psi_R_e, Psi_I_e = Psi_R[:, e].copy(), Psi_I[:, e].copy()
+        H_R_e, H_I_e = np.zeros(N + 1), np.zeros(N + 1)
+        apply_hamiltonian(Psi_R_e, Psi_I_e, H_R_e, H_I_e, x, dx, K[e] * np.sin(W[e] * t))
+        save_observables(Psi_R_e, Psi_I_e, H_R_e, H_I_e, norm[e], x_mean[e], energy[e], 0, x, dx)
+        H_R[:, e], H_I[:, e] = H_R_e, H_I_e
+
+    sim_loop_batch(Psi_R, Psi_I, H_R, H_I, norm, x_mean, energy, S, S_out, x, dx, tau, W, t, K)
+
+    return times, norm, x_mean, energy
+
+
+@my_timer(2)
+def main(output: str = None, plot: bool = True):
+
+    # Read data from file and run simulation
+    times, norm, x_mean, energy = simulate(*read_parameters(), output=output)
+
     # Plots
-    draw_plot(times, x_mean, energy)
-    # ----------------------------------------------------------------
+    if plot:
+        draw_plot(times, x_mean, energy)
 
 
 # Main
 if __name__ == '__main__':
+    print(f'sim_loop compile (or cache load) time: {compile_time:.5f} sec.')
     main()
 
 # We see average time execution with numbs is aroud 3 seconds
@@ -0,0 +1,155 @@
+# Call this script: python sweep.py [sweep_py.txt] [results_dir] [name=values ...]
+#                   python sweep.py --plot <results_dir> <job>
+# Resonance scan of the driven quantum particle over omega, K, n and m
+#
+# The sweep file has the format of parameters_py.txt, but omega, K, n and m may be given as
+# a list '2,4,8' or an inclusive range 'start:stop:step'. The same may be given in command line,
+# e.g. omega=90:110:2, and overrides the file.
+#
+# Results directory:
+# jobs.csv    - job number and parameters of every combination
+# results.npy - observables, shape (3, jobs, S // S_out + 1), rows are norm, x_mean, energy
+# ledger.txt  - numbers of finished jobs, a rerun skips them and continues the sweep
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from sys import argv
+from os import path
+from lab06 import simulate, draw_plot
+import numpy as np
+import csv
+import os
+
+
+# Parameters in the order of parameters_py.txt
+NAMES = ['N', 'n', 'm', 'omega', 'K', 't', 'tau', 'S', 'S_out']
+# Parameters which may be swept
+SWEPT = ['n', 'm', 'omega', 'K']
+
+
+# Function to change text to number
+def to_number(text: str):
+    return int(text) if text.lstrip('-').isdigit() else float(text)
+
+
+# Function to change list or range text to list of numbers
+def parse_values(text: str):
+
+    if ':' in text:
+        start, stop, step = (to_number(value) for value in text.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return [start + i * step for i in range(count)]
+
+    return [to_number(value) for value in text.split(',')]
+
+
+# Function to read sweep file, returns dictionary with list of values for each parameter
+def read_sweep(filename: str, overrides: list):
+
+    with open(filename, 'r') as file:
+        data = file.read().split()
+
+    # Names in the file may have '%' prefix, like '%omega'
+    values = {name.lstrip('%'): parse_values(value) for value, name in zip(data[0::2], data[1::2])}
+    for override in overrides:
+        name, value = override.split('=')
+        values[name] = parse_values(value)
+
+    for name in NAMES:
+        if name not in values:
+            raise ValueError(f'Missing parameter \'{name}\'')
+        if name not in SWEPT and len(values[name]) != 1:
+            raise ValueError(f'Parameter \'{name}\' can not be swept')
+
+    return values
+
+
+# Function to create list of jobs, each job is a tuple of parameters in NAMES order
+def make_jobs(values: dict):
+    return list(product(*(values[name] for name in NAMES)))
+
+
+# Function to read numbers of finished jobs
+def read_ledger(directory: str):
+
+    ledger = path.join(directory, 'ledger.txt')
+    if not path.exists(ledger):
+        return set()
+
+    with open(ledger, 'r') as file:
+        return {int(line) for line in file if line.strip()}
+
+
+# Function to run one job in worker process, observables go straight into its part of results.npy
+def run_job(directory: str, job: int, parameters: tuple):
+
+    results = np.load(path.join(directory, 'results.npy'), mmap_mode='r+')
+    _, norm, x_mean, energy = simulate(*parameters)
+    results[:, job] = norm, x_mean, energy
+    results.flush()
+
+    return job
+
+
+# Function to run all unfinished jobs in process pool
+def sweep(values: dict, directory: str, processes: int = None):
+
+    os.makedirs(directory, exist_ok=True)
+    jobs = make_jobs(values)
+    k = values['S'][0] // values['S_out'][0] + 1
+
+    # jobs.csv and results.npy are created by the first run and reused by the next ones
+    jobs_file = path.join(directory, 'jobs.csv')
+    results_file = path.join(directory, 'results.npy')
+    if path.exists(jobs_file):
+        with open(jobs_file, 'r', newline='') as file:
+            saved = [tuple(to_number(value) for value in row[1:]) for row in list(csv.reader(file))[1:]]
+        if saved != jobs:
+            raise ValueError(f'Directory \'{directory}\' holds results of another sweep')
+    else:
+        with open(jobs_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['job'] + NAMES)
+            writer.writerows([job] + list(parameters) for job, parameters in enumerate(jobs))
+        np.lib.format.open_memmap(results_file, mode='w+', dtype=float, shape=(3, len(jobs), k)).flush()
+
+    finished = read_ledger(directory)
+    todo = [job for job in range(len(jobs)) if job not in finished]
+    print(f'{len(jobs)} jobs, {len(finished)} finished, {len(todo)} to run')
+
+    with ProcessPoolExecutor(processes) as pool, open(path.join(directory, 'ledger.txt'), 'a') as ledger:
+        futures = [pool.submit(run_job, directory, job, jobs[job]) for job in todo]
+        for future in as_completed(futures):
+            # Job is written to ledger only when its observables are already saved
+            ledger.write(f'{future.result()}\n')
+            ledger.flush()
+
+
+# Function to plot observables of one job from results directory
+def plot_job(directory: str, job: int):
+
+    results = np.load(path.join(directory, 'results.npy'), mmap_mode='r')
+    with open(path.join(directory, 'jobs.csv'), 'r', newline='') as file:
+        row = list(csv.reader(file))[job + 1]
+    parameters = dict(zip(NAMES, (to_number(value) for value in row[1:])))
+
+    k = results.shape[2]
+    times = np.linspace(0, 50, k, dtype=float)
+    filename = path.join(directory, f'quantum_{job}.png')
+    draw_plot(times, results[1, job], results[2, job], filename)
+    print(f'Saved plot of job {job} {parameters} to file \'{filename}\'')
+
+
+# MAIN
+if __name__ == '__main__':
+
+    if len(argv) > 1 and argv[1] == '--plot':
+        try:
+            plot_job(argv[2], int(argv[3]))
+        except (IndexError, ValueError):
+            print(f'Usage: {path.basename(__file__)} --plot <results_dir> <job>')
+            exit(1)
+    else:
+        filename = argv[1] if len(argv) > 1 else 'sweep_py.txt'
+        directory = argv[2] if len(argv) > 2 else 'sweep_results'
+        sweep(read_sweep(filename, argv[3:]), directory)
@@ -0,0 +1,46 @@
+# Call this script: python benchmark.py
+# Scaling of the parallel checkerboard kernel over state sizes and thread counts
+
+from numba import config, set_num_threads
+from lab07 import calculate_new_state_parallel, make_rng_states
+import numpy as np
+import time
+
+
+# Function to measure mean time of one sweep with given number of threads
+def sweep_time(size: int, threads: int, sweeps: int):
+
+    set_num_threads(threads)
+    state = np.random.randint(2, size=(size, size)).astype(np.int8) * 2 - 1
+    rng_states = make_rng_states(size, 2021)
+
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        calculate_new_state_parallel(state, size, 0.7, 0.45, 0.0, rng_states)
+    stop = time.perf_counter()
+
+    return (stop - start) / sweeps
+
+
+# MAIN
+if __name__ == '__main__':
+
+    # State sizes
+    sizes = [64, 128, 256, 512, 1024, 2048, 4096]
+    # Thread counts, doubled up to all available threads
+    threads = [1]
+    while threads[-1] * 2 <= config.NUMBA_NUM_THREADS:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != config.NUMBA_NUM_THREADS:
+        threads.append(config.NUMBA_NUM_THREADS)
+    # Sweeps per measurement
+    sweeps = 10
+
+    # Compile before measuring
+    sweep_time(8, 1, 1)
+
+    print('Time of one sweep [ms] (speedup against 1 thread)')
+    print(f'{"size":>6}' + ''.join(f'{f"{t} threads":>22}' for t in threads))
+    for size in sizes:
+        times = [sweep_time(size, t, sweeps) for t in threads]
+        print(f'{size:>6}' + ''.join(f'{t * 1000:>13.3f} ({times[0] / t:>5.2f}x)' for t in times))
@@ -0,0 +1,73 @@
+# Call this script: python benchmark_cluster.py
+# Effective (independent) samples per second of cluster updates against Metropolis near the critical point
+
+from lab07 import simulation, calculate_energy, seed_random
+import numpy as np
+import time
+
+
+# Integrated autocorrelation time with automatic window (Sokal), in steps
+def autocorrelation_time(series: np.ndarray, c: float = 5.0):
+
+    x = series - series.mean()
+    if not np.any(x):
+        return 0.5
+    n = len(x)
+    transform = np.fft.rfft(x, 2 * n)
+    rho = np.fft.irfft(transform * np.conj(transform))[:n]
+    rho /= rho[0]
+
+    tau = 0.5
+    for window in range(1, n):
+        tau += rho[window]
+        if window >= c * tau:
+            break
+    return max(tau, 0.5)
+
+
+# Function to measure time per step and autocorrelation time of |m| and energy for given engine
+def measure(engine: str, size: int, J: float, beta: float, H: float, thermalisation: int, steps: int):
+
+    state = np.ones((size, size), dtype=np.int8)
+    seed_random(2021)
+    simulation(state, size, J, beta, H, thermalisation, engine, seed=2021)
+
+    magnetisation = np.empty(steps)
+    energy = np.empty(steps)
+    step_time = 0.0
+    for step in range(steps):
+        start = time.perf_counter()
+        simulation(state, size, J, beta, H, 1, engine)
+        step_time += time.perf_counter() - start
+        magnetisation[step] = abs(state.sum()) / (size * size)
+        energy[step] = calculate_energy(state, size, J, H) / (size * size)
+
+    step_time /= steps
+    tau = max(autocorrelation_time(magnetisation), autocorrelation_time(energy))
+    return step_time, tau, 1.0 / (2.0 * tau * step_time)
+
+
+# MAIN
+if __name__ == '__main__':
+
+    # Exchange integral, field and temperature near the transition
+    # (calculate_energy counts every pair twice, so beta_c = 0.2203 / J)
+    J = 1.0
+    H = 0.0
+    beta = 0.2203
+    # State sizes
+    sizes = [16, 32]
+    engines = ['metropolis', 'checkerboard', 'wolff', 'swendsen-wang']
+    thermalisation = 1000
+    steps = 3000
+
+    # Compile before measuring
+    for engine in engines:
+        simulation(np.ones((4, 4), dtype=np.int8), 4, J, beta, H, 1, engine)
+
+    print(f'J = {J}, beta = {beta}, H = {H}')
+    print(f'{"size":>6}{"engine":>16}{"step [ms]":>12}{"tau [steps]":>14}{"samples/s":>14}')
+    for size in sizes:
+        for engine in engines:
+            step_time, tau, rate = measure(engine, size, J, beta, H, thermalisation, steps)
+            print(f'{size:>6}{engine:>16}{step_time * 1000:>12.4f}{tau:>14.2f}{rate:>14.1f}')
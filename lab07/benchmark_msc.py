@@ -0,0 +1,58 @@
+# Call this script: python benchmark_msc.py
+# Throughput of multi-spin coding (64 replicas in uint64) against the int8 checkerboard kernel
+
+from lab07 import (calculate_new_state_parallel, calculate_new_state_msc, make_rng_states,
+                   make_thresholds, pack_replicas)
+import numpy as np
+import time
+
+
+# Function to measure spin updates per nanosecond of the int8 kernel (one replica)
+def int8_throughput(size: int, J: float, beta: float, H: float, sweeps: int):
+
+    state = np.random.randint(2, size=(size, size)).astype(np.int8) * 2 - 1
+    rng_states = make_rng_states(size, 2021)
+
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        calculate_new_state_parallel(state, size, J, beta, H, rng_states)
+    stop = time.perf_counter()
+
+    return size * size * sweeps / ((stop - start) * 1e9)
+
+
+# Function to measure spin updates per nanosecond of the multi-spin coded kernel (64 replicas)
+def msc_throughput(size: int, J: float, beta: float, H: float, sweeps: int):
+
+    states = np.random.randint(2, size=(64, size, size)).astype(np.int8) * 2 - 1
+    words = pack_replicas(states)
+    thresholds = make_thresholds(J, beta, H)
+    rng_states = make_rng_states(size, 2021)
+
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        calculate_new_state_msc(words, size, thresholds, rng_states)
+    stop = time.perf_counter()
+
+    return 64 * size * size * sweeps / ((stop - start) * 1e9)
+
+
+# MAIN
+if __name__ == '__main__':
+
+    J = 1.0
+    beta = 0.2203
+    H = 0.0
+    sizes = [64, 256, 1024, 2048]
+    sweeps = 10
+
+    # Compile before measuring
+    int8_throughput(8, J, beta, H, 1)
+    msc_throughput(8, J, beta, H, 1)
+
+    print('Spin updates per ns (memory: int8 1 byte per spin, multi-spin coding 1 bit per spin)')
+    print(f'{"size":>6}{"int8":>12}{"msc x64":>12}{"speedup":>10}')
+    for size in sizes:
+        int8 = int8_throughput(size, J, beta, H, sweeps)
+        msc = msc_throughput(size, J, beta, H, sweeps)
+        print(f'{size:>6}{int8:>12.3f}{msc:>12.3f}{msc / int8:>9.1f}x')
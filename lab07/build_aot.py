@@ -0,0 +1,19 @@
+# Call this script: python build_aot.py
+# Builds extension module lab07_aot with ahead-of-time compiled kernels,
+# lab07.simulation uses it instead of the JIT kernels when it can be imported
+
+from numba.pycc import CC
+from lab07 import calculate_energy, calculate_new_state, seed_random
+from lab07 import ENERGY_SIGNATURES, NEW_STATE_SIGNATURES, SEED_SIGNATURE
+
+
+# MAIN
+if __name__ == '__main__':
+
+    cc = CC('lab07_aot')
+    cc.export('calculate_energy', ENERGY_SIGNATURES[0])(calculate_energy.py_func)
+    cc.export('calculate_new_state', NEW_STATE_SIGNATURES[0])(calculate_new_state.py_func)
+    # The module has its own random state, simulation seeds it with this function
+    cc.export('seed_random', SEED_SIGNATURE)(seed_random.py_func)
+    cc.compile()
+    print(f'Built module \'{cc.name}\' in {cc.output_dir}')
@@ -1,11 +1,23 @@
-from numba import jit
+from numba import jit, prange
 import numpy as np
 import random
 import time
 
+# Kernels with signatures are compiled when the module is imported, the others on the first call,
+# all of them are cached on disk in __pycache__, so the next runs only load them
+compile_start = time.perf_counter()
+
+# Signatures of eagerly compiled kernels, for int8 states and for int64 ones made by np.random.randint,
+# the first (int8) ones are also used by build_aot.py
+ENERGY_SIGNATURES = ['float64(int8[:, :], int64, float64, float64)',
+                     'float64(int64[:, :], int64, float64, float64)']
+NEW_STATE_SIGNATURES = ['void(int8[:, :], int64, float64, float64, float64)',
+                        'void(int64[:, :], int64, float64, float64, float64)']
+SEED_SIGNATURE = 'void(int64)'
+
 
 # Calculate current system energy
-@jit(nopython=True, fastmath=True)
+@jit(ENERGY_SIGNATURES, nopython=True, fastmath=True, cache=True)
 def calculate_energy(state: np.ndarray, size: int, J: float, H: float):
     # Interaction energy between neighbours
     nodes_energy = 0
@@ -29,8 +41,8 @@ def calculate_energy(state: np.ndarray, size: int, J: float, H: float):
 
 
 # Calculate new spins configuration
-@jit(nopython=True, fastmath=True)
-def calculate_new_state(state: np.ndarray, size: int, beta: float):
+@jit(NEW_STATE_SIGNATURES, nopython=True, fastmath=True, cache=True)
+def calculate_new_state(state: np.ndarray, size: int, J: float, beta: float, H: float):
 
     # As many cases as many spins
     for _ in range(size * size):
@@ -57,11 +69,331 @@ def calculate_new_state(state: np.ndarray, size: int, beta: float):
                 state[i, j] = -state[i, j]
 
 
-# Main simulation 
-def simulation(state: np.ndarray, size: int, beta: float, N: int):
+# Create independent random streams, one for each row of state
+def make_rng_states(size: int, seed: int = None):
+    return np.random.default_rng(seed).integers(1, 2 ** 63, size=size, dtype=np.uint64)
+
+
+# Next 64 random bits of xorshift64* stream, returns new stream state and bits
+@jit(nopython=True, inline='always', cache=True)
+def next_word(x):
+    x ^= x >> np.uint64(12)
+    x ^= x << np.uint64(25)
+    x ^= x >> np.uint64(27)
+    return x, x * np.uint64(2685821657736338717)
+
+
+# Next uniform number from [0, 1) of xorshift64* stream, returns new stream state and number
+@jit(nopython=True, inline='always', cache=True)
+def next_random(x):
+    x, out = next_word(x)
+    return x, (out >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+# Calculate new spins configuration on all cores with checkerboard updates
+# Spins of one colour have neighbours only of the other colour, so rows can be updated in parallel
+# Every row has its own random stream, so the result does not depend on the number of threads
+@jit(nopython=True, fastmath=True, parallel=True, cache=True)
+def calculate_new_state_parallel(state: np.ndarray, size: int, J: float, beta: float, H: float,
+                                 rng_states: np.ndarray):
+
+    # Acceptance probability for spin (-1 -> 0, 1 -> 1) and sum of neighbours (-4 -> 0, ..., 4 -> 4)
+    acceptance = np.empty((2, 5))
+    for s in range(2):
+        for n in range(5):
+            delta_energy = 2 * (2 * s - 1) * (2 * J * (2 * n - 4) + H)
+            acceptance[s, n] = min(1.0, np.exp(-beta * delta_energy))
+
+    for colour in range(2):
+        for i in prange(size):
+            x = rng_states[i]
+            for j in range((i + colour) % 2, size, 2):
+                s_c = state[i, j]
+                neighbours = (state[(i + 1) % size, j] + state[(i - 1) % size, j] +
+                              state[i, (j - 1) % size] + state[i, (j + 1) % size])
+                x, r = next_random(x)
+                if r < acceptance[(s_c + 1) // 2, (neighbours + 4) // 2]:
+                    state[i, j] = -s_c
+            rng_states[i] = x
+
+
+# Seed random generator used inside compiled functions (lab07_aot has its own copy of it)
+@jit(SEED_SIGNATURE, nopython=True, cache=True)
+def seed_random(seed: int):
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+# Wolff single-cluster update, returns size of the cluster
+# calculate_energy counts every pair twice, so a bond between equal spins has energy -2J
+# and is added to the cluster with probability 1 - exp(-4 * beta * J)
+# The field is taken into account by accepting the cluster flip with probability exp(-beta * dE_H)
+@jit(nopython=True, fastmath=True, cache=True)
+def wolff_step(state: np.ndarray, size: int, J: float, beta: float, H: float):
+
+    p_add = 1.0 - np.exp(-4.0 * beta * J)
+    in_cluster = np.zeros((size, size), dtype=np.bool_)
+    stack = np.empty((size * size, 2), dtype=np.int64)
+
+    # Random seed spin
+    i = np.random.randint(0, size)
+    j = np.random.randint(0, size)
+    spin = state[i, j]
+    in_cluster[i, j] = True
+    stack[0, 0] = i
+    stack[0, 1] = j
+    top = 1
+    cluster = [(i, j)]
+
+    while top > 0:
+        top -= 1
+        i = stack[top, 0]
+        j = stack[top, 1]
+        for k in range(4):
+            if k == 0:
+                ni, nj = (i + 1) % size, j
+            elif k == 1:
+                ni, nj = (i - 1) % size, j
+            elif k == 2:
+                ni, nj = i, (j + 1) % size
+            else:
+                ni, nj = i, (j - 1) % size
+            if not in_cluster[ni, nj] and state[ni, nj] == spin and np.random.random() < p_add:
+                in_cluster[ni, nj] = True
+                stack[top, 0] = ni
+                stack[top, 1] = nj
+                top += 1
+                cluster.append((ni, nj))
+
+    # Energy change with the field when the whole cluster flips
+    delta_energy = 2.0 * H * spin * len(cluster)
+    if delta_energy <= 0 or np.random.random() < np.exp(-beta * delta_energy):
+        for i, j in cluster:
+            state[i, j] = -spin
+
+    return len(cluster)
+
+
+# Find root of site in union-find forest, with path halving
+@jit(nopython=True, inline='always', cache=True)
+def find_root(parent: np.ndarray, site: int):
+    while parent[site] != site:
+        parent[site] = parent[parent[site]]
+        site = parent[site]
+    return site
+
+
+# Swendsen-Wang update, returns number of clusters
+# Bonds between equal neighbours are activated with the same probability as in wolff_step,
+# clusters are labelled with union-find and every cluster gets a new spin from the heat bath
+# of the field, +1 with probability 1 / (1 + exp(-2 * beta * H * cluster_size))
+@jit(nopython=True, fastmath=True, cache=True)
+def swendsen_wang_step(state: np.ndarray, size: int, J: float, beta: float, H: float):
+
+    p_add = 1.0 - np.exp(-4.0 * beta * J)
+    sites = size * size
+    parent = np.arange(sites)
+
+    for i in range(size):
+        for j in range(size):
+            site = i * size + j
+            # Each bond once: down and right neighbours
+            for ni, nj in (((i + 1) % size, j), (i, (j + 1) % size)):
+                if state[ni, nj] == state[i, j] and np.random.random() < p_add:
+                    root_a = find_root(parent, site)
+                    root_b = find_root(parent, ni * size + nj)
+                    if root_a != root_b:
+                        parent[root_a] = root_b
+
+    # Cluster sizes at roots
+    roots = np.empty(sites, dtype=np.int64)
+    cluster_size = np.zeros(sites, dtype=np.int64)
+    for site in range(sites):
+        roots[site] = find_root(parent, site)
+        cluster_size[roots[site]] += 1
+
+    # New spin for every cluster
+    new_spin = np.zeros(sites, dtype=np.int8)
+    clusters = 0
+    for site in range(sites):
+        if cluster_size[site] > 0:
+            clusters += 1
+            if np.random.random() < 1.0 / (1.0 + np.exp(-2.0 * beta * H * cluster_size[site])):
+                new_spin[site] = 1
+            else:
+                new_spin[site] = -1
+
+    for site in range(sites):
+        state[site // size, site % size] = new_spin[roots[site]]
+
+    return clusters
+
+
+# ---------------------------------------------------------------------------
+# Multi-spin coding: bit r of word [i, j] is spin (i, j) of replica r (1 is +1, 0 is -1)
+# so 64 independent replicas take as much memory as 8 int8 states
+
+# Bits of acceptance probability thresholds
+THRESHOLD_BITS = 32
+
+
+# Pack up to 64 replicas of +1/-1 states, shape (replicas, size, size), into one uint64 array
+def pack_replicas(states: np.ndarray):
+    words = np.zeros(states.shape[1:], dtype=np.uint64)
+    for replica, state in enumerate(states):
+        words |= (state > 0).astype(np.uint64) << np.uint64(replica)
+    return words
+
+
+# Unpack uint64 array into +1/-1 states of replicas, shape (replicas, size, size)
+def unpack_replicas(words: np.ndarray, replicas: int = 64):
+    bits = (words[np.newaxis] >> np.arange(replicas, dtype=np.uint64)[:, np.newaxis, np.newaxis]) & np.uint64(1)
+    return bits.astype(np.int8) * 2 - 1
+
+
+# Acceptance probabilities as THRESHOLD_BITS fixed point numbers, for spin (-1 -> 0, 1 -> 1)
+# and number of misaligned neighbours k, then the sum of neighbours times spin is 4 - 2k
+def make_thresholds(J: float, beta: float, H: float):
+    thresholds = np.empty((2, 5), dtype=np.uint64)
+    for s in range(2):
+        spin = 2 * s - 1
+        for k in range(5):
+            delta_energy = 2 * (2 * J * (4 - 2 * k) + H * spin)
+            probability = min(1.0, np.exp(-beta * delta_energy))
+            thresholds[s, k] = int(probability * 2 ** THRESHOLD_BITS)
+    return thresholds
+
+
+# Calculate new spins configuration of 64 replicas with multi-spin coding and checkerboard updates
+# Misaligned neighbours are counted for all replicas at once with a bit-sliced adder of XORs
+# Every replica gets its own random bit: r < p is decided bit by bit from the most significant bit,
+# comparing random words with per-replica threshold bits, usually after a few words
+@jit(nopython=True, fastmath=True, parallel=True, cache=True)
+def calculate_new_state_msc(words: np.ndarray, size: int, thresholds: np.ndarray, rng_states: np.ndarray):
+
+    always = np.uint64(1 << THRESHOLD_BITS)
+    zero = np.uint64(0)
+    one = np.uint64(1)
+
+    for colour in range(2):
+        for i in prange(size):
+            x = rng_states[i]
+            classes = np.empty(10, dtype=np.uint64)
+            for j in range((i + colour) % 2, size, 2):
+                s_c = words[i, j]
+                a = s_c ^ words[(i + 1) % size, j]
+                b = s_c ^ words[(i - 1) % size, j]
+                c = s_c ^ words[i, (j - 1) % size]
+                d = s_c ^ words[i, (j + 1) % size]
+
+                # k = a + b + c + d as three bit planes
+                s1 = a ^ b
+                c1 = a & b
+                s2 = c ^ d
+                c2 = c & d
+                bit0 = s1 ^ s2
+                carry = s1 & s2
+                bit1 = c1 ^ c2 ^ carry
+                bit2 = (c1 & c2) | ((c1 ^ c2) & carry)
+
+                # Replicas in each class (spin, k), class index is 5 * spin + k
+                classes[0] = ~bit2 & ~bit1 & ~bit0
+                classes[1] = ~bit2 & ~bit1 & bit0
+                classes[2] = ~bit2 & bit1 & ~bit0
+                classes[3] = ~bit2 & bit1 & bit0
+                classes[4] = bit2
+                for k in range(5):
+                    classes[5 + k] = classes[k] & s_c
+                    classes[k] = classes[k] & ~s_c
+
+                accept = zero
+                undecided = zero
+                for n in range(10):
+                    threshold = thresholds[n // 5, n % 5]
+                    if threshold >= always:
+                        accept |= classes[n]
+                    elif threshold > zero:
+                        undecided |= classes[n]
+
+                bit = THRESHOLD_BITS - 1
+                while undecided != zero and bit >= 0:
+                    p_bits = zero
+                    for n in range(10):
+                        if (thresholds[n // 5, n % 5] >> np.uint64(bit)) & one:
+                            p_bits |= classes[n]
+                    x, r_bits = next_word(x)
+                    # Random bit 0 and threshold bit 1 means r < p, different bits decide
+                    accept |= undecided & ~r_bits & p_bits
+                    undecided &= ~(r_bits ^ p_bits)
+                    bit -= 1
+
+                words[i, j] = s_c ^ accept
+            rng_states[i] = x
+
+
+# Simulation of 64 replicas with multi-spin coding (even size only)
+def simulation_msc(words: np.ndarray, size: int, J: float, beta: float, H: float, N: int, seed: int = None):
+
+    if size % 2 != 0:
+        raise ValueError('Multi-spin coding kernel needs an even state size')
+    thresholds = make_thresholds(J, beta, H)
+    rng_states = make_rng_states(size, seed)
     for _ in range(N):
-        calculate_new_state(state, size, beta)
-    return new_state
+        calculate_new_state_msc(words, size, thresholds, rng_states)
+    return words
+# ---------------------------------------------------------------------------
+
+
+compile_time = time.perf_counter() - compile_start
+
+# Optional ahead-of-time compiled kernels, build them with: python build_aot.py
+try:
+    import lab07_aot
+    # Module built before seed_random was exported can not be seeded, so it is ignored
+    if not hasattr(lab07_aot, 'seed_random'):
+        lab07_aot = None
+except ImportError:
+    lab07_aot = None
+
+
+# Available engines for simulation
+# 'metropolis'    - single spin flips, one step is size * size attempts
+# 'checkerboard'  - parallel checkerboard Metropolis, one step is one sweep (even size only)
+# 'wolff'         - one step is one Wolff cluster update
+# 'swendsen-wang' - one step is one Swendsen-Wang update of the whole state
+engines = ('metropolis', 'checkerboard', 'wolff', 'swendsen-wang')
+
+
+# Main simulation
+def simulation(state: np.ndarray, size: int, J: float, beta: float, H: float, N: int,
+               engine: str = 'metropolis', seed: int = None):
+
+    if engine not in engines:
+        raise ValueError(f'Unknown engine \'{engine}\', choose one of: {", ".join(engines)}')
+    if seed is not None:
+        seed_random(seed)
+        if lab07_aot is not None:
+            lab07_aot.seed_random(seed)
+
+    if engine == 'checkerboard':
+        if size % 2 != 0:
+            raise ValueError('Checkerboard kernel needs an even state size')
+        rng_states = make_rng_states(size, seed)
+        for _ in range(N):
+            calculate_new_state_parallel(state, size, J, beta, H, rng_states)
+    elif engine == 'wolff':
+        for _ in range(N):
+            wolff_step(state, size, J, beta, H)
+    elif engine == 'swendsen-wang':
+        for _ in range(N):
+            swendsen_wang_step(state, size, J, beta, H)
+    else:
+        # Ahead-of-time kernel is built only for int8 states
+        aot = lab07_aot is not None and state.dtype == np.int8
+        kernel = lab07_aot.calculate_new_state if aot else calculate_new_state
+        for _ in range(N):
+            kernel(state, size, J, beta, H)
+    return state
 
 
 # MAIN
@@ -88,13 +420,14 @@ if __name__ == '__main__':
 
     # Calculate new state
     new_state = state 
-    start = time.time()
-    new_state = simulation(new_state, size, beta, N)
-    stop = time.time()
+    start = time.perf_counter()
+    new_state = simulation(new_state, size, J, beta, H, N)
+    stop = time.perf_counter()
     print(str(new_state).replace(' [', '').replace('[', '').replace(']', ''))
     print('\n')
+    print(f'Compile (or cache load) time: {compile_time:.5f} sec.')
     print(f'Execution time: {(stop - start):.5f} sec.')
 
     # For parameters: size=18, J=0.7, beta = 0.1, H=2.5, N=50
-    # With Numba:     0.796 s
+    # With Numba:     0.796 s (compilation on the first call included)
     # Without Numba:  13.42 s
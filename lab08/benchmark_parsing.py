@@ -0,0 +1,94 @@
+# Call this script: python benchmark_parsing.py [page.html ...]
+# Time of finding image links with full BeautifulSoup tree, SoupStrainer and crawler.page_links (lxml
+# selector, used by the crawler). Every method resolves links with urljoin against the page url.
+# Without arguments an index page with many links (like the lab server listing) is generated
+
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urldefrag
+from functools import partial
+from sys import argv
+from bs4 import BeautifulSoup, SoupStrainer
+from crawler import page_links, has_extension
+from lab08 import image_extensions
+import time
+import os
+
+
+# Base of found links
+base = 'http://www.if.pw.edu.pl/~mrow/dyd/wdprir/'
+
+
+# Function to keep absolute addresses of images among hrefs of page
+def image_hrefs(hrefs, base: str):
+    links = (urldefrag(urljoin(base, str(href).strip())).url for href in hrefs)
+    return [link for link in links if has_extension(link, image_extensions)]
+
+
+# Function to find image urls in page with full BeautifulSoup tree (the previous lab08 approach)
+def image_links(page, base: str):
+    soup = BeautifulSoup(page, 'html.parser')
+    return image_hrefs((a['href'] for a in soup.find_all('a', href=True)), base)
+
+
+# Function to find image urls in page, only <a> tags are built by BeautifulSoup
+def image_links_strainer(page, base: str):
+    soup = BeautifulSoup(page, 'lxml', parse_only=SoupStrainer('a', href=True))
+    return image_hrefs((a['href'] for a in soup.find_all('a', href=True)), base)
+
+
+# Function to find image urls in page like the crawler does
+def image_links_crawler(page, base: str):
+    return [link for link in page_links(page, base) if has_extension(link, image_extensions)]
+
+
+# Function to create directory listing page with given number of files
+def make_listing(files: int):
+    extensions = ['png', 'jpg', 'txt', 'pdf', 'jpeg', 'py']
+    rows = ''.join(
+        f'<tr><td valign="top"><img src="/icons/image2.gif" alt="[IMG]"></td>'
+        f'<td><a href="file{i}.{extensions[i % len(extensions)]}">file{i}.{extensions[i % len(extensions)]}</a>'
+        f'</td><td align="right">2021-03-{i % 28 + 1:02d} 12:00  </td><td align="right">{i % 900 + 10}K</td></tr>\n'
+        for i in range(files))
+    return (f'<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n<html><head><title>Index of /~mrow/dyd/wdprir'
+            f'</title></head><body><h1>Index of /~mrow/dyd/wdprir</h1><table>\n{rows}</table></body></html>\n'
+            ).encode('utf-8')
+
+
+# Function to measure time of finding links in all pages
+def measure(function, pages: list, processes: int = 0):
+
+    start = time.perf_counter()
+    if processes:
+        with ProcessPoolExecutor(processes) as pool:
+            links = list(pool.map(partial(function, base=base), pages, chunksize=max(1, len(pages) // processes)))
+    else:
+        links = [function(page, base) for page in pages]
+    stop = time.perf_counter()
+
+    return stop - start, links
+
+
+# MAIN
+if __name__ == '__main__':
+
+    if len(argv) > 1:
+        pages = []
+        for filename in argv[1:]:
+            with open(filename, 'rb') as file:
+                pages.append(file.read())
+    else:
+        pages = [make_listing(2000)] * 20
+
+    print(f'{len(pages)} pages, {sum(len(page) for page in pages) / 2**20:.2f} MiB')
+    print(f'{"method":>28}{"time [s]":>12}{"pages/s":>12}{"speedup":>10}')
+    processes = os.cpu_count()
+    reference, expected = measure(image_links, pages)
+    for name, function, workers in [
+        ('full soup (html.parser)', image_links, 0),
+        ('SoupStrainer (lxml)', image_links_strainer, 0),
+        ('crawler.page_links (lxml)', image_links_crawler, 0),
+        (f'page_links, {processes} processes', image_links_crawler, processes),
+    ]:
+        elapsed, links = measure(function, pages, workers)
+        assert links == expected, f'{name} found other links'
+        print(f'{name:>28}{elapsed:>12.4f}{len(pages) / elapsed:>12.1f}{reference / elapsed:>9.1f}x')
@@ -0,0 +1,237 @@
+# Asynchronous crawler: follows links from seed pages up to given depth and downloads the found files
+# Call this script: python crawler.py <url> [depth] [directory] [workers]
+#
+# Links are resolved with urljoin against <base href> of the page they come from, or against its final url
+# (after redirects), fragments are dropped and every url is visited once. Pages are parsed only if they
+# are text/html, files are recognised by extension or by content type. With same_host only pages of the
+# seed hosts are followed, files may come from any host.
+# Every host gets at most per_host requests at once and at least delay seconds between their starts.
+# Found files go straight into a download queue, so they are downloaded while the crawl still continues.
+# Every file is saved as directory/host/path of its url (a query adds its short hash to the name), through
+# its own temporary file renamed only when the transfer is complete.
+
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from urllib.parse import urljoin, urldefrag, urlsplit
+from sys import argv
+from lxml import etree
+import lxml.html
+import aiohttp
+import tempfile
+import asyncio
+import hashlib
+import os
+
+
+# Extensions of files to download
+FILE_EXTENSIONS = ['jpeg', 'png', 'jpg']
+# Content types of files to download (prefixes)
+FILE_TYPES = ['image/']
+# Precompiled selectors of link addresses and of base address of page
+href_selector = etree.XPath('//a/@href')
+base_selector = etree.XPath('(//base/@href)[1]')
+
+
+# Function to check if url has one of extensions
+def has_extension(url: str, extensions: list):
+    name = urlsplit(url).path
+    return name[name.rfind('.')+1:].lower() in extensions
+
+
+# Function to find absolute addresses of links in page, url is the final address of page
+def page_links(page: bytes, url: str):
+
+    try:
+        tree = lxml.html.fromstring(page)
+    except (etree.ParserError, ValueError):
+        return []
+    base = base_selector(tree)
+    if base:
+        url = urljoin(url, str(base[0]).strip())
+    links = []
+    for href in href_selector(tree):
+        link = urldefrag(urljoin(url, str(href).strip())).url
+        if urlsplit(link).scheme in ('http', 'https'):
+            links.append(link)
+    return links
+
+
+class Crawler:
+
+    def __init__(self, seeds: list, depth: int = 1, directory: str = None, workers: int = 8,
+                 downloaders: int = 4, per_host: int = 2, delay: float = 0.1, same_host: bool = True,
+                 extensions: list = FILE_EXTENSIONS, types: list = FILE_TYPES, timeout: float = 30):
+
+        self.seeds = seeds
+        self.depth = depth
+        # Files are only collected when directory is None
+        self.directory = directory
+        self.workers = workers
+        self.downloaders = downloaders
+        self.per_host = per_host
+        self.delay = delay
+        self.hosts = {urlsplit(seed).netloc for seed in seeds} if same_host else None
+        self.extensions = extensions
+        self.types = types
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+        self.visited = set()
+        # Found files in the order of discovery, and downloaded ones {url: file}
+        self.files = []
+        self.downloaded = {}
+        self.pages = 0
+
+    # Function to check if url looks like a file by its extension
+    def is_file(self, url: str):
+        return has_extension(url, self.extensions)
+
+    # Function to check if content type belongs to files
+    def is_file_type(self, content_type: str):
+        return any(content_type.startswith(prefix) for prefix in self.types)
+
+    # Function to return local file of url, the same name from other host, path or query gives other file
+    def destination(self, url: str):
+        parts = urlsplit(url)
+        segments = [segment for segment in parts.path.split('/') if segment not in ('', '.', '..')]
+        name = segments.pop() if segments and not parts.path.endswith('/') else 'index'
+        if parts.query:
+            stem, extension = os.path.splitext(name)
+            name = f'{stem}_{hashlib.sha1(parts.query.encode()).hexdigest()[:8]}{extension}'
+        return os.path.join(self.directory, parts.netloc.replace(':', '_'), *segments, name)
+
+    # Context manager waiting until request to host of url is polite
+    @asynccontextmanager
+    async def polite(self, url: str):
+
+        host = urlsplit(url).netloc
+        async with self.host_sems[host]:
+            async with self.host_locks[host]:
+                loop = asyncio.get_running_loop()
+                wait = self.next_start[host] - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.next_start[host] = loop.time() + self.delay
+            yield
+
+    # Function to put file url into download queue (once)
+    def add_file(self, url: str):
+        if url not in self.visited:
+            self.visited.add(url)
+            self.files.append(url)
+            if self.directory is not None:
+                self.file_queue.put_nowait((url,))
+
+    # Function to put page url into crawl queue (once)
+    def add_page(self, url: str, depth: int):
+        if url not in self.visited and (self.hosts is None or urlsplit(url).netloc in self.hosts):
+            self.visited.add(url)
+            self.page_queue.put_nowait((url, depth))
+
+    # Function to fetch page and queue its links
+    async def crawl_page(self, session: aiohttp.ClientSession, url: str, depth: int):
+
+        async with self.polite(url), session.get(url) as response:
+            if response.status != 200:
+                return
+            content_type = response.headers.get('Content-Type', '')
+            # Link without known extension turned out to be a file
+            if self.is_file_type(content_type):
+                self.visited.discard(url)
+                self.add_file(url)
+                return
+            if 'text/html' not in content_type:
+                return
+            page = await response.read()
+            # Relative links are relative to the page after redirects (e.g. /dir -> /dir/)
+            final_url = str(response.url)
+
+        self.pages += 1
+        for link in page_links(page, final_url):
+            if self.is_file(link):
+                self.add_file(link)
+            elif depth < self.depth:
+                self.add_page(link, depth + 1)
+
+    # Function to download file to temporary file and rename it, only files of accepted types are kept
+    async def download(self, session: aiohttp.ClientSession, url: str):
+
+        destination = self.destination(url)
+        async with self.polite(url), session.get(url) as response:
+            if response.status != 200 or not self.is_file_type(response.headers.get('Content-Type', '')):
+                return
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(destination))
+            try:
+                with open(descriptor, 'wb') as file:
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        file.write(chunk)
+            except BaseException:
+                os.remove(temporary)
+                raise
+        os.replace(temporary, destination)
+        self.downloaded[url] = destination
+
+    # Worker taking items from queue until it is cancelled, errors of one item do not stop it
+    async def worker(self, queue: asyncio.Queue, function, session: aiohttp.ClientSession):
+        while True:
+            item = await queue.get()
+            try:
+                await function(session, *item)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as error:
+                print(f'Failed {item[0]}: {type(error).__name__}: {error}')
+            finally:
+                queue.task_done()
+
+    # Function to crawl from seeds and download files, returns list of found files
+    async def run(self):
+
+        self.page_queue = asyncio.Queue()
+        self.file_queue = asyncio.Queue()
+        self.host_sems = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self.host_locks = defaultdict(asyncio.Lock)
+        self.next_start = defaultdict(float)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+        for seed in self.seeds:
+            self.add_page(urldefrag(seed).url, 0)
+
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            workers = [asyncio.create_task(self.worker(self.page_queue, self.crawl_page, session))
+                       for _ in range(self.workers)]
+            if self.directory is not None:
+                workers += [asyncio.create_task(self.worker(self.file_queue, self.download, session))
+                            for _ in range(self.downloaders)]
+
+            # Downloads run during the whole crawl, the file queue is empty only after it
+            await self.page_queue.join()
+            await self.file_queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return self.files
+
+
+# Function to find file urls from seed pages without downloading them
+def crawl_links(seeds: list, depth: int = 0, **options):
+    return asyncio.run(Crawler(seeds, depth, **options).run())
+
+
+# MAIN
+if __name__ == '__main__':
+
+    # simple protection
+    try:
+        url = argv[1]
+        depth = int(argv[2]) if len(argv) > 2 else 1
+        directory = argv[3] if len(argv) > 3 else 'crawl'
+        workers = int(argv[4]) if len(argv) > 4 else 8
+    except (IndexError, ValueError):
+        print(f'Usage: {os.path.basename(__file__)} <url> [depth] [directory] [workers]')
+        exit(1)
+
+    crawler = Crawler([url], depth, directory, workers)
+    asyncio.run(crawler.run())
+    print(f'Crawled {crawler.pages} pages, found {len(crawler.files)} files, '
+          f'downloaded {len(crawler.downloaded)} to \'{directory}\'')
@@ -1,6 +1,5 @@
 from multiprocessing.pool import ThreadPool
-from bs4 import BeautifulSoup
-import requests
+from crawler import crawl_links
 import os
 import wget
 import time
@@ -9,19 +8,13 @@ import time
 # Directories names
 seq_dir = 'seq'
 multi_dir = 'multi'
+# Extensions of downloaded images
+image_extensions = ['jpeg', 'png', 'jpg']
 
 
-# Function to find urls from www
-def find_urls(url: str):
-    req = requests.get(url)
-    soup = BeautifulSoup(req.text, 'html.parser')
-    links = []
-    # Save urls to png files
-    for a in soup.find_all('a', href=True):
-        if a['href'][a['href'].rfind('.')+1:] in ['jpeg', 'png', 'jpg']:
-            links.append('http://www.if.pw.edu.pl/~mrow/dyd/wdprir/'+str(a['href']))
-        
-    return links
+# Function to find urls from www, pages linked from url are also searched up to depth
+def find_urls(url: str, depth: int = 0):
+    return crawl_links([url], depth, extensions=image_extensions)
 
 
 # Function to save images with one process
@@ -59,7 +52,8 @@ if __name__ == '__main__':
     create_dir(seq_dir)
     create_dir(multi_dir)
 
-    # Find urls from www
+    # Find urls from www, then download them, so that only the download time is compared
+    # (crawler.py downloads the found files while the crawl still continues)
     url = 'http://www.if.pw.edu.pl/~mrow/dyd/wdprir/'
     links = find_urls(url)
 
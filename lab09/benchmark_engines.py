@@ -0,0 +1,182 @@
+# Call this script: python benchmark_engines.py [name=value ...]
+# Download engines of lab08 and lab09 over the same files served by local_server.py
+#
+# Engines: sequential (wget loop of lab08), threads (ThreadPool of lab08), processes (process Pool)
+# and asyncio (aiohttp download_file of lab09), every engine at every concurrency level of 'levels'.
+# Each run is a fresh process, so its peak RSS and CPU time are not mixed with the other runs.
+# Failed transfers (e.g. with failures > 0) are counted in column 'failed', latencies and throughput
+# are of the downloaded files only. A run whose process dies is reported and the benchmark goes on.
+#
+# Settings (defaults in SETTINGS and local_server.SETTINGS), e.g.:
+#   python benchmark_engines.py files=200 sizes=uniform:100000:2000000 latency=0.05 bandwidth=5e6 levels=1,8,32
+#   output=results.csv saves the table
+
+from multiprocessing import get_context
+from multiprocessing.pool import ThreadPool
+from http.client import HTTPException
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from statistics import quantiles
+from queue import Empty
+from sys import argv
+from lab09 import download_file
+from local_server import start_server, SETTINGS as SERVER_SETTINGS
+import aiohttp
+import asyncio
+import resource
+import wget
+import time
+import csv
+import io
+import os
+
+
+# Default settings of the benchmark
+SETTINGS = {'engines': 'sequential,threads,processes,asyncio', 'levels': '1,4,16,64', 'port': 8731,
+            'output': ''}
+# Longest wait for the result of one run in seconds
+RUN_TIMEOUT = 3600
+# Columns of the results table
+COLUMNS = ['engine', 'workers', 'files', 'failed', 'MiB', 'time [s]', 'files/s', 'MiB/s', 'p50 [ms]', 'p99 [ms]',
+           'peak RSS [MiB]', 'CPU [s]', 'CPU [%]']
+
+
+# Function to download one file like lab08, returns latency and size (None if download failed)
+def download_wget(url: str, directory: str):
+
+    destination = os.path.join(directory, url[url.rfind('/') + 1:])
+    start = time.perf_counter()
+    try:
+        wget.download(url, destination, bar=None)
+    except (OSError, HTTPException):
+        return time.perf_counter() - start, None
+    return time.perf_counter() - start, os.path.getsize(destination)
+
+
+# Function to run synchronous engine over urls, returns list of (latency, size or None)
+def run_sync(engine: str, urls: list, workers: int, directory: str):
+
+    arguments = [(url, directory) for url in urls]
+    if engine == 'sequential':
+        return [download_wget(*argument) for argument in arguments]
+    if engine == 'threads':
+        with ThreadPool(workers) as pool:
+            return pool.starmap(download_wget, arguments, chunksize=1)
+    if engine == 'processes':
+        with get_context('fork').Pool(workers) as pool:
+            return pool.starmap(download_wget, arguments, chunksize=1)
+    raise ValueError(f'Unknown engine \'{engine}\'')
+
+
+# Function to download urls with lab09 download_file, at most workers transfers at once
+async def run_asyncio(urls: list, workers: int, directory: str):
+
+    limit = asyncio.Semaphore(workers)
+    # download_file takes its own semaphore, here the limit is kept outside to time only the transfer
+    unlimited = asyncio.Semaphore(len(urls))
+
+    async def timed(url: str, session: aiohttp.ClientSession):
+        destination = os.path.join(directory, url[url.rfind('/') + 1:])
+        async with limit:
+            start = time.perf_counter()
+            try:
+                downloaded = await download_file(url, session, unlimited, destination)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                downloaded = False
+            return time.perf_counter() - start, os.path.getsize(destination) if downloaded else None
+
+    connector = aiohttp.TCPConnector(limit=workers)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*(timed(url, session) for url in urls))
+
+
+# Function to return CPU time of this process and its finished children
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+
+
+# Function to run one engine in fresh process and put measurements into queue
+def measure(engine: str, urls: list, workers: int, queue):
+
+    # Start-up and imports of the process are not counted
+    cpu_start = cpu_time()
+    with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if engine == 'asyncio':
+            transfers = asyncio.run(run_asyncio(urls, workers, directory))
+        else:
+            transfers = run_sync(engine, urls, workers, directory)
+        elapsed = time.perf_counter() - start
+
+    cpu = cpu_time() - cpu_start
+    # ru_maxrss is in kilobytes on Linux, worker processes are counted by the largest of them
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+    downloaded = [(latency, size) for latency, size in transfers if size is not None]
+    latencies = sorted(latency for latency, _ in downloaded)
+    if len(latencies) > 1:
+        p50, p99 = (quantiles(latencies, n=100, method='inclusive')[i] for i in (49, 98))
+    else:
+        p50 = p99 = latencies[0] if latencies else float('nan')
+    size = sum(size for _, size in downloaded) / 2**20
+    queue.put([engine, workers, len(downloaded), len(transfers) - len(downloaded), size, elapsed,
+               len(downloaded) / elapsed, size / elapsed, p50 * 1000, p99 * 1000, peak, cpu, 100 * cpu / elapsed])
+
+
+# Function to wait for the row of run, returns None if its process died or did not answer in time
+def wait_row(process, queue, timeout: float = RUN_TIMEOUT):
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if process.exitcode is not None:
+                # The row may still be in the pipe after the process finished
+                try:
+                    return queue.get(timeout=1)
+                except Empty:
+                    return None
+    return None
+
+
+# MAIN
+if __name__ == '__main__':
+
+    settings = {**SERVER_SETTINGS, **SETTINGS, **dict(override.split('=', 1) for override in argv[1:])}
+    server_settings = {name: settings[name] for name in SERVER_SETTINGS}
+    engines = settings['engines'].split(',')
+    levels = [int(level) for level in settings['levels'].split(',')]
+
+    server, urls = start_server(int(settings['port']), **server_settings)
+    context = get_context('spawn')
+    rows = []
+    print(f'Server: {server_settings}')
+    print(''.join(f'{column:>15}' for column in COLUMNS))
+    try:
+        for engine in engines:
+            for workers in [1] if engine == 'sequential' else levels:
+                queue = context.Queue()
+                process = context.Process(target=measure, args=(engine, urls, workers, queue))
+                process.start()
+                row = wait_row(process, queue)
+                if row is None:
+                    process.terminate()
+                    process.join()
+                    print(f'{engine:>15}{workers:>15}   run failed (exit code {process.exitcode})')
+                    continue
+                process.join()
+                rows.append(row)
+                print(''.join(f'{value:>15.2f}' if isinstance(value, float) else f'{value:>15}' for value in row))
+    finally:
+        server.terminate()
+
+    if settings['output']:
+        with open(settings['output'], 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        print(f'Saved results to file \'{settings["output"]}\'')
@@ -1,40 +1,148 @@
-from asyncio import Semaphore, gather, run, wait_for
-from aiohttp.client import ClientSession
+from asyncio import Semaphore, TimeoutError, gather, run, sleep, wait_for
+from aiohttp.client import ClientSession, ClientError
+from aiohttp import TCPConnector, ClientTimeout
+from collections import defaultdict
+from urllib.parse import urlsplit
+from time import perf_counter
 from sys import argv, stderr
 from os import path
 import aiofiles
+import random
 import json
+import os
+import re
 
 
-# Function to async download file from url
-async def download_file(url, session, sem, dest_file):
+# Size of parts of response copied to file
+CHUNK_SIZE = 64 * 1024
+# Statuses worth another attempt
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Longest pause between attempts in seconds
+MAX_BACKOFF = 30.0
+
+
+# Function to async download file from url without any limits
+# Response is streamed in chunks into dest_file + '.part', which is renamed to dest_file only when
+# its size agrees with Content-Length, so memory use does not depend on file size. Partial file of
+# an interrupted download is resumed with Range request. Body is requested and saved without content
+# encoding, because Content-Length and byte ranges refer to the bytes sent, not the decompressed ones.
+# Returns status of the last response and size of downloaded file (None if it was not completed)
+async def transfer(url, session, dest_file, chunk_size=CHUNK_SIZE):
+    temporary = f'{dest_file}.part'
+
+    # The second attempt is a full download, when partial file can not be resumed
+    for _ in range(2):
+        offset = path.getsize(temporary) if path.exists(temporary) else 0
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        async with session.get(url, headers=headers, auto_decompress=False) as res:
+            content_range = re.fullmatch(r'bytes (\d+)-\d+/(\d+)|bytes \*/(\d+)',
+                                         res.headers.get('Content-Range', ''))
+
+            # Partial file is already complete
+            if res.status == 416 and content_range and content_range.group(3) == str(offset):
+                break
+            # Server ignores Range, sends other part or rejects it: start from the beginning
+            if offset and (res.status == 416 or (res.status == 206 and (
+                    not content_range or content_range.group(1) != str(offset)))):
+                os.remove(temporary)
+                continue
+
+            # Check everything went well, before anything is written
+            if res.status not in (200, 206):
+                print(f'Download failed: {res.status}')
+                return res.status, None
+
+            if res.status == 206:
+                mode = 'ab'
+                expected = int(content_range.group(2)) if content_range else None
+            else:
+                mode = 'wb'
+                expected = res.content_length
+
+            async with aiofiles.open(temporary, mode) as f:
+                async for chunk in res.content.iter_chunked(chunk_size):
+                    await f.write(chunk)
+
+        size = path.getsize(temporary)
+        if expected is not None and size != expected:
+            # Partial file is kept and resumed next time
+            print(f'Download incomplete: {size} of {expected} bytes')
+            return res.status, None
+        break
+
+    os.replace(temporary, dest_file)
+    return res.status, path.getsize(dest_file)
+
+
+# Function to async download file from url, at most sem downloads at once, returns True if file was downloaded
+async def download_file(url, session, sem, dest_file, chunk_size=CHUNK_SIZE):
     async with sem:
         print(f'Downloading {url}')
-        async with session.get(url) as res:
-            content = await res.read()
+        _, size = await transfer(url, session, dest_file, chunk_size)
+        return size is not None
+
+
+# Function to async download file with retries, the download waits first for a free connection to its host
+# (host_sem) and then for a free connection at all (sem). Only the transfer itself is limited by timeout,
+# transient errors are retried after exponential backoff with full jitter, during which no connection is held
+# Returns dictionary with url, file, status, bytes, duration (of all transfers), attempts and error
+async def download_with_retries(url, session, sem, host_sem, dest_file, timeout, retries, backoff):
+    result = {'url': url, 'file': dest_file, 'status': None, 'bytes': None, 'duration': 0.0,
+              'attempts': 0, 'error': None}
+
+    while True:
+        async with host_sem, sem:
+            result['attempts'] += 1
+            print(f'Downloading {url} (attempt {result["attempts"]})')
+            start = perf_counter()
+            try:
+                result['status'], result['bytes'] = await wait_for(transfer(url, session, dest_file), timeout)
+                result['error'] = None
+            except (ClientError, TimeoutError, OSError) as error:
+                result['status'] = None
+                result['error'] = f'{type(error).__name__}: {error}'.rstrip(': ')
+            result['duration'] += perf_counter() - start
+
+        if result['bytes'] is not None:
+            return result
+
+        # Errors of connection, timeouts, incomplete bodies and some statuses are transient
+        transient = result['status'] is None or result['status'] in RETRY_STATUSES or \
+            result['status'] in (200, 206)
+        if not transient or result['attempts'] > retries:
+            if result['error'] is None:
+                result['error'] = f'HTTP {result["status"]}'
+            return result
 
-        # Check everything went well
-        if res.status != 200:
-            print(f'Download failed: {res.status}')
-            return
+        await sleep(random.uniform(0, min(MAX_BACKOFF, backoff * 2 ** (result['attempts'] - 1))))
 
-        async with aiofiles.open(dest_file, '+wb') as f:
-            await f.write(content)
-            
 
-# Function to async download several files 
-async def download_several_files(urls: list, time: int, tasks: int):
+# Function to async download several files
+# At most tasks downloads at once and at most per_host of them from one host, every attempt has time
+# seconds for the transfer, returns list of results of download_with_retries in the order of urls
+async def download_several_files(urls: list, time: int, tasks: int, per_host: int = None, retries: int = 3,
+                                 backoff: float = 0.5):
     tasks_list = []
     sem = Semaphore(tasks)
+    per_host = per_host or tasks
+    host_sems = defaultdict(lambda: Semaphore(per_host))
 
-    async with ClientSession() as session:
+    connector = TCPConnector(limit=tasks, limit_per_host=per_host)
+    # The timeout of every attempt is owned by wait_for, the session only drops connections stalled for so long
+    # (its default total of 300 s would silently cap longer times)
+    timeout = ClientTimeout(total=None, sock_read=time)
+    async with ClientSession(connector=connector, timeout=timeout) as session:
         for url in urls:
             # assumes that the last segment after the / represents the file name
             # if url is abc/xyz/file.txt, the file name will be file.txt
             file_name_start_pos = url.rfind("/") + 1
             file_name = url[file_name_start_pos:]
             dest_file = f'file_{file_name}.pdf'
-            tasks_list.append(wait_for(download_file(url, session, sem, dest_file), timeout = time))
+            host_sem = host_sems[urlsplit(url).netloc]
+            tasks_list.append(download_with_retries(url, session, sem, host_sem, dest_file, time, retries, backoff))
 
         return await gather(*tasks_list)
 
@@ -46,8 +154,10 @@ if __name__ == '__main__':
         filename = argv[1]
         time = int(argv[2])
         tasks = int(argv[3])
-    except IndexError:
-        print(f'Usage: {path.basename(__file__)} <filename.json> <time> <tasks>')
+        per_host = int(argv[4]) if len(argv) > 4 else None
+        retries = int(argv[5]) if len(argv) > 5 else 3
+    except (IndexError, ValueError):
+        print(f'Usage: {path.basename(__file__)} <filename.json> <time> <tasks> [per_host] [retries]')
         exit(1)
     
     if not path.exists(filename):
@@ -57,4 +167,11 @@ if __name__ == '__main__':
     with open(filename, 'r', encoding = 'utf-8') as json_file:
         files = json.load(json_file)
 
-    run(download_several_files(files, time, tasks))
+    results = run(download_several_files(files, time, tasks, per_host, retries))
+    for result in results:
+        if result['error']:
+            print(f'Failed {result["url"]} after {result["attempts"]} attempts: {result["error"]}', file = stderr)
+    downloaded = [result for result in results if result['error'] is None]
+    print(f'Downloaded {len(downloaded)} of {len(results)} files, '
+          f'{sum(result["bytes"] for result in downloaded)} bytes')
+    exit(0 if len(downloaded) == len(results) else 3)
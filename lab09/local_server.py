@@ -0,0 +1,165 @@
+# Local HTTP server with generated files for download benchmarks and tests
+# Call this script: python local_server.py [port] [name=value ...]
+#
+# Files /files/<i>.pdf have sizes drawn from a distribution and deterministic content.
+# Every response waits latency seconds before the first byte and is sent with at most
+# bandwidth bytes per second (per connection, 0 - unlimited). Range requests are answered
+# with 206 Partial Content, so interrupted downloads can be resumed. A fraction 'failures' of
+# requests is answered with 503 Service Unavailable, to test retries.
+#
+# Sizes: 'fixed:<bytes>', 'uniform:<min>:<max>' or 'lognormal:<mu>:<sigma>' (of the natural log of bytes)
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import get_context
+from sys import argv
+import random
+import socket
+import time
+import re
+
+
+# Default settings of the server
+SETTINGS = {'files': 100, 'sizes': 'lognormal:12:1', 'latency': 0.0, 'bandwidth': 0.0, 'failures': 0.0,
+            'seed': 2021}
+# Size of written parts of files
+CHUNK_SIZE = 64 * 1024
+
+
+# Function to draw file sizes from distribution text
+def make_sizes(files: int, sizes: str, seed: int):
+
+    rng = random.Random(seed)
+    kind, *values = sizes.split(':')
+    values = [float(value) for value in values]
+    if kind == 'fixed':
+        return [int(values[0])] * files
+    if kind == 'uniform':
+        return [rng.randint(int(values[0]), int(values[1])) for _ in range(files)]
+    if kind == 'lognormal':
+        return [max(1, int(rng.lognormvariate(*values))) for _ in range(files)]
+    raise ValueError(f'Unknown size distribution \'{sizes}\'')
+
+
+# Function to create deterministic content of file, the same for every request
+def file_content(index: int, size: int):
+    pattern = f'%PDF-1.4 file {index} '.encode() * (CHUNK_SIZE // 16)
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+class FileHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Set by serve
+    sizes = []
+    latency = 0.0
+    bandwidth = 0.0
+    failures = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    # Function to send headers and return (index, start, stop) of body or None
+    def send_file_headers(self):
+
+        match = re.fullmatch(r'/files/(\d+)\.pdf', self.path)
+        if not match or int(match.group(1)) >= len(self.sizes):
+            self.send_error(404)
+            return None
+
+        index = int(match.group(1))
+        size = self.sizes[index]
+        start, stop = 0, size
+        time.sleep(self.latency)
+        if random.random() < self.failures:
+            self.send_error(503)
+            return None
+
+        range_match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if range_match:
+            start = int(range_match.group(1))
+            stop = min(size, int(range_match.group(2)) + 1) if range_match.group(2) else size
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{stop - 1}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(stop - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return index, start, stop
+
+    def do_HEAD(self):
+        self.send_file_headers()
+
+    def do_GET(self):
+
+        body = self.send_file_headers()
+        if body is None:
+            return
+
+        index, start, stop = body
+        content = file_content(index, self.sizes[index])
+        begin = time.perf_counter()
+        for position in range(start, stop, CHUNK_SIZE):
+            chunk = content[position:min(stop, position + CHUNK_SIZE)]
+            self.wfile.write(chunk)
+            if self.bandwidth:
+                # Sleep until the sent bytes fit into the bandwidth
+                delay = (position + len(chunk) - start) / self.bandwidth - (time.perf_counter() - begin)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class FileServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # Many clients connect at once in benchmarks
+    request_queue_size = 1024
+
+
+# Function to run server forever, settings like SETTINGS
+def serve(port: int = 8000, **settings):
+
+    settings = {**SETTINGS, **settings}
+    FileHandler.sizes = make_sizes(int(settings['files']), settings['sizes'], int(settings['seed']))
+    FileHandler.latency = float(settings['latency'])
+    FileHandler.bandwidth = float(settings['bandwidth'])
+    FileHandler.failures = float(settings['failures'])
+
+    FileServer(('127.0.0.1', port), FileHandler).serve_forever()
+
+
+# Function to start server in separate process (its CPU time is not counted to the client),
+# returns process and urls of all files
+def start_server(port: int = 8000, **settings):
+
+    settings = {**SETTINGS, **settings}
+    process = get_context('spawn').Process(target=serve, args=(port,), kwargs=settings, daemon=True)
+    process.start()
+
+    # Wait until server accepts connections
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    urls = [f'http://127.0.0.1:{port}/files/{i}.pdf' for i in range(int(settings['files']))]
+    return process, urls
+
+
+# MAIN
+if __name__ == '__main__':
+
+    port = int(argv[1]) if len(argv) > 1 and '=' not in argv[1] else 8000
+    settings = dict(override.split('=') for override in argv[1:] if '=' in override)
+    print(f'Serving {settings or SETTINGS} on http://127.0.0.1:{port}/files/<i>.pdf')
+    serve(port, **settings)